@@ -1,31 +1,52 @@
 from gi import require_versions
 require_versions({"Gtk": "4.0", "Adw": "1"})
 from gi.repository import Gtk, GLib
-from requests.auth import HTTPBasicAuth
-from icalendar import Calendar, Todo
-from datetime import datetime, timezone, date
-from dotenv import load_dotenv
-import xml.etree.ElementTree as ET
-import requests
+from datetime import datetime, date
 import threading
 import os
 import uuid
-from urllib.parse import urlparse, urljoin
 from .dialogs import error_dialog, setup_dialog
-from .window import TaskObject
+from .store import OpLog
+from .calendars import CalendarCollection, calendar_list, load_calendar_list, save_calendar_list, select_calendars
+from .index import TaskIndex
+from .worker import WorkQueue, run_bulk
+from .tree import build_rows
+from .vtodo import parse_resources
+
+# Seconds before the op log is replayed again while the server is unreachable
+WRITE_RETRY_MIN = 15
+WRITE_RETRY_MAX = 600
+# Merge-and-retry rounds on a 412 before a change is given up
+CONFLICT_RETRIES = 3
+# Conflict reported for a DELETE of a task edited elsewhere
+DELETE_CONFLICT = 'DELETE'
+# Answers that will never take a queued change; anything else (401, 408, 423,
+# 429, 5xx...) keeps it queued for a retry
+REFUSED_STATUS = frozenset({400, 403, 405, 409, 412, 413, 415, 422})
+
+# icalendar, requests (through .dav) and dotenv are imported where first used,
+# the window is presented with GTK alone
 
 class Application(Gtk.Application):
-    def __init__(self):
+    def __init__(self, profile=None):
         super().__init__(application_id="com.sickmitch.NCTasks")
-        self.task_list = [] 
+        self.profile = profile  # StartupProfile with --profile-startup, else None
         self.uid = []
-        self.collapsed_parents = set()  # Track collapsed parent UIDs
-        self.first_load = True  # Track if this is the first load
+        self.view_generation = 0  # Bumped per view rebuild, stale builds are dropped
+        self.collections = {}  # Calendar name -> CalendarCollection, first one takes new tasks
+        self.refresh = None  # RefreshScheduler when AUTO_REFRESH is set
+        self.write_retry = None  # Timer replaying the op log after an outage
+        self.write_retry_delay = WRITE_RETRY_MIN
+        self.worker = WorkQueue(self.set_ui_state)  # Runs network I/O off the GTK thread
     def do_activate(self):
         from .window import Window
         self.window = Window(self)
+        if self.profile is not None:
+            self.profile.watch(self.window)
+        self.window.connect("notify::is-active", self.on_focus_changed)
         self.window.present()
-        self.load_environment_vars()
+        # Idle priority runs after the first frame has been drawn
+        GLib.idle_add(self.load_environment_vars)
 
     ### ADD BUTTON HANDLER
     def on_add_clicked(self):
@@ -48,6 +69,7 @@ class Application(Gtk.Application):
         status = status_map.get(status_text, "NEEDS-ACTION")
         priority_map = {"Low": 9, "Medium": 5, "High": 1}
         priority = priority_map.get(priority_text, 9)
+        from icalendar import Calendar, Todo
         # Generate a unique UID for the task
         uid = str(uuid.uuid4())
         # Create a Todo component
@@ -65,6 +87,7 @@ class Application(Gtk.Application):
         todo.add('status', status)
         todo.add('priority', priority)
         todo.add('dtstamp', datetime.now())
+        parent_uid = None
         if hasattr(self, 'is_secondary'):
             if self.is_secondary is True:
                 if len(self.parent_uid) != 1:
@@ -72,6 +95,7 @@ class Application(Gtk.Application):
                         error_dialog(self.window, f"Double parent equal managed")
                         self.parent_uid = [self.parent_uid[0]]
                 if len(self.parent_uid) == 1:
+                    parent_uid = self.parent_uid[0]
                     todo.add('related-to', self.parent_uid)
                     self.is_secondary = False
                     self.parent_uid.clear()
@@ -84,25 +108,19 @@ class Application(Gtk.Application):
         cal.add_component(todo)
         # Generate the .ics data
         ics_data = cal.to_ical()
-        # Determine the URL for the new task on the server
-        event_url = f"{self.cal_url}/{uid}.ics"
-        #  Push the .ics data to the server using PUT, handle errors
-        try:
-            response = requests.put(
-                url=event_url,
-                headers={
-                    'Content-Type': 'text/calendar; charset=utf-8',
-                },
-                auth=HTTPBasicAuth(self.user, self.api_key),
-                data=ics_data
-            )
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            error_dialog(self.window, f"Failed to add task to server: {e}")
+        if self.default_collection is None:
+            error_dialog(self.window, "No task list to add the task to")
             return
+        # Subtasks go to their parent's calendar, other new tasks to the first one
+        collection = self.collections.get(self.index.collection(parent_uid)) or self.default_collection
+        # Determine the href for the new task on the server
+        event_href = collection.dav.href_for(uid)
+        # Show the task right away, then push the .ics data to the server in background
+        self.index.set_resource(event_href, '', ics_data, collection=collection.name)
         # Reset input fields and update the task list
         self.reset_input()
-        self.start_async_fetch()
+        self.update_task_list()
+        self.submit_writes("Adding", [(event_href, ics_data, '', None)])
     
     ### SYNC BUTTON HANDLER
     def on_sync_clicked(self, button):
@@ -111,31 +129,12 @@ class Application(Gtk.Application):
     ### DELETE BUTTON HANDLER
     def on_del_clicked(self, button):
         uids_to_remove = self.get_selection()
-
-        try:
-            uid_to_href = self.extract_uid_to_href()
-        except ValueError as e:
-            error_dialog(self.window, str(e))
-            return
-
-        parsed_cal_url = urlparse(self.cal_url)
-        server_base = f"{parsed_cal_url.scheme}://{parsed_cal_url.netloc}"
-
-        for uid in uids_to_remove:
-            event_href = uid_to_href.get(uid)
-
-            event_url = urljoin(server_base, event_href)
-            try:
-                # Send a DELETE request to the server
-                response = requests.delete(
-                    url=event_url,
-                    auth=HTTPBasicAuth(self.user, self.api_key))
-                response.raise_for_status() 
-                self.window.status_bar.push(0, "Task successfully deleted from server")
-            except requests.exceptions.RequestException as e:
-                error_dialog(self.window, f"Failed to delete task from server: {e}")
-        # Save the updated calendar and refresh the task list
-        self.start_async_fetch()
+        writes = [(self.index.href(uid), None, self.index.etag(uid), None) for uid in uids_to_remove if uid in self.index]
+        # Drop the tasks locally first, the store keeps them until the server confirms
+        for event_href, _, _, _ in writes:
+            self.index.remove_resource(event_href)
+        self.update_task_list()
+        self.submit_writes("Deleting", writes)
     
     ### EDIT BUTTON HANDLER
     def on_edit_clicked(self, button): 
@@ -144,11 +143,10 @@ class Application(Gtk.Application):
         self.window.set_focus(self.window.task_entry)
         self.uid = self.get_selection()[0]
         # Find the VTODO component
-        # todo = None
-        for component in self.cal.walk():
-            if component.name == 'VTODO' and str(component.get('uid')) == self.uid:
-                self.todo = component
-                break
+        self.todo = self.index.component(self.uid)
+        # The version the edit is made on, sent as its precondition and merge base
+        entry = self.index.get(self.uid)
+        self.edit_href, self.edit_etag, self.edit_base = entry.href, entry.etag, entry.data
         # Get current values
         self.current_summary = str(self.todo.get('summary', ''))
         self.current_description = str(self.todo.get('description', ''))
@@ -201,6 +199,11 @@ class Application(Gtk.Application):
         status = status_map.get(status_text, "NEEDS-ACTION")
         priority_map = {"Low": 9, "Medium": 5, "High": 1}
         priority = priority_map.get(priority_text, 9)
+        if self.uid not in self.index:
+            # Deleted here or by a sync while the edit was open
+            self.reset_input()
+            error_dialog(self.window, "! The task was deleted while it was being edited !")
+            return
         # Update the VTODO component
         self.todo['summary'] = task
         self.todo['priority'] = priority
@@ -226,35 +229,21 @@ class Application(Gtk.Application):
         elif 'due' in self.todo:
             del self.todo['due']
         # Prepare and send PUT request
+        from icalendar import Calendar
         cal = Calendar()
         cal.add('prodid', '-//NCTasks//')
         cal.add('version', '2.0')
         cal.add_component(self.todo)
 
-        try:
-            uid_to_href = self.extract_uid_to_href()
-        except ValueError as e:
-            error_dialog(self.window, str(e))
-            return
-        event_href = uid_to_href.get(self.uid)
-        parsed_cal_url = urlparse(self.cal_url)
-        server_base = f"{parsed_cal_url.scheme}://{parsed_cal_url.netloc}"
-
-        try:
-            event_url = urljoin(server_base, event_href)
-            response = requests.put(
-                event_url,
-                headers={'Content-Type': 'text/calendar; charset=utf-8'},
-                auth=HTTPBasicAuth(self.user, self.api_key),
-                data=cal.to_ical()
-            )
-            response.raise_for_status()
-        except Exception as e:
-            raise Exception(f"API error: {str(e)}")
-        
+        ics_data = cal.to_ical()
+        # Sent on the version the edit started from, not whatever a sync loaded since
+        event_href, etag = self.edit_href, self.edit_etag
+        # Re-index from the new data so the list shows the edit right away
+        self.index.set_resource(event_href, etag, ics_data)
         # Reset input fields
         self.reset_input()
-        self.start_async_fetch()
+        self.update_task_list()
+        self.submit_writes("Saving", [(event_href, ics_data, etag, self.edit_base)])
 
     ### SECONDARY BUTTON HANDLER
     def on_secondary_clicked(self, button):
@@ -269,98 +258,239 @@ class Application(Gtk.Application):
 
     ### GET TASK SUMMARY BY UID
     def get_task_summary_by_uid(self, uid):
-        for component in self.cal.walk():
-            if component.name == 'VTODO' and str(component.get('uid')) == uid:
-                return str(component.get('summary'))
+        record = self.index.record(uid)
+        if record is not None:
+            return str(record.summary)
 
     ### WALKER BUTTON HANDLER
     def walker_clicked(self, button):
-        self.uid = self.get_selection()[0]
-        # Find the VTODO component
-        for component in self.cal.walk():
-            if component.name == 'VTODO' and str(component.get('uid')) == self.uid:
-                todo = component
-                break
-
-        current_status = str(todo.get('status'))
-        if current_status == "NEEDS-ACTION":
-            status = "IN-PROCESS"
-        if current_status == "IN-PROCESS":
-            status = "COMPLETED"
-
-        todo['status'] = status
-
-        # Prepare and send PUT request
-        cal = Calendar()
-        cal.add('prodid', '-//NCTasks//')
-        cal.add('version', '2.0')
-        cal.add_component(todo)
-
-        try:
-            uid_to_href = self.extract_uid_to_href()
-        except ValueError as e:
-            error_dialog(self.window, str(e))
-            return
-        event_href = uid_to_href.get(self.uid)
-        parsed_cal_url = urlparse(self.cal_url)
-        server_base = f"{parsed_cal_url.scheme}://{parsed_cal_url.netloc}"
-
-        try:
-            event_url = urljoin(server_base, event_href)
-            response = requests.put(
-                event_url,
-                headers={'Content-Type': 'text/calendar; charset=utf-8'},
-                auth=HTTPBasicAuth(self.user, self.api_key),
-                data=cal.to_ical()
-            )
-            response.raise_for_status()
-        except Exception as e:
-            raise Exception(f"API error: {str(e)}")
-        
-        self.start_async_fetch()
+        next_status = {"NEEDS-ACTION": "IN-PROCESS", "IN-PROCESS": "COMPLETED"}
+        self.update_status(lambda current: next_status.get(current))
 
     ### COMPLETE BUTTON HANDLER
     def complete_clicked(self, button):
-        self.uid = self.get_selection()[0]
-        # Find the VTODO component
-        for component in self.cal.walk():
-            if component.name == 'VTODO' and str(component.get('uid')) == self.uid:
-                todo = component
-                break
-        
-        status = "COMPLETED"
-        todo['status'] = status
-
-        # Prepare and send PUT request
-        cal = Calendar()
-        cal.add('prodid', '-//NCTasks//')
-        cal.add('version', '2.0')
-        cal.add_component(todo)
-
-        try:
-            uid_to_href = self.extract_uid_to_href()
-        except ValueError as e:
-            error_dialog(self.window, str(e))
+        self.update_status(lambda current: "COMPLETED")
+
+    ### SET STATUS ON EVERY SELECTED TASK AND PUT THEM IN PARALLEL
+    def update_status(self, new_status):
+        from icalendar import Calendar
+        writes = []
+        for uid in self.get_selection():
+            # Find the VTODO component
+            todo = self.index.component(uid)
+            if todo is None:
+                continue
+            status = new_status(self.index.record(uid).status)
+            if status is None:
+                continue
+            todo['status'] = status
+            # Prepare PUT request
+            cal = Calendar()
+            cal.add('prodid', '-//NCTasks//')
+            cal.add('version', '2.0')
+            cal.add_component(todo)
+            entry = self.index.get(uid)
+            event_href, etag, base = entry.href, entry.etag, entry.data
+            ics_data = cal.to_ical()
+            self.index.set_resource(event_href, etag, ics_data)
+            writes.append((event_href, ics_data, etag, base))
+        self.update_task_list()
+        self.submit_writes("Updating", writes)
+
+    ### LOCAL CHANGES: LOGGED DURABLY, THEN SENT
+    # writes is a list of (href, ics_data, etag, base), ics_data None meaning DELETE,
+    # etag the version the change was made on ('' for a new task) and base that
+    # version's data. They are already applied to the index, the op log keeps them
+    # across restarts and outages
+    def submit_writes(self, label, writes):
+        if not writes:
             return
-        event_href = uid_to_href.get(self.uid)
-        parsed_cal_url = urlparse(self.cal_url)
-        server_base = f"{parsed_cal_url.scheme}://{parsed_cal_url.netloc}"
-
+        for event_href, ics_data, etag, base in writes:
+            self.oplog.append(event_href, ics_data, etag, base)
+        self.flush_writes(label)
+
+    ### REPLAY THE OP LOG IN ORDER, WITH If-Match
+    # Ops for one href go out one after the other, different hrefs concurrently.
+    # Sent ops land in the store with the server ETag. An unreachable server or an
+    # answer outside REFUSED_STATUS (auth, rate limit, 5xx) stops the replay and
+    # keeps the rest queued for a retry; an op the server definitively refuses is
+    # dropped with the rest of its href and rolled back from the store.
+    # The ops are claimed when the job runs, a flush queued behind another one only
+    # sees what is still pending
+    def flush_writes(self, label="Sending"):
+        import requests
+        offline = threading.Event()
+        held = []  # Why the replay stopped, for the status bar
+
+        def send(group):
+            sent = []
+            stale = None
+            unsent = [op[0] for op in group]  # Claimed, handed back if not sent
+            try:
+                for seq, event_href, ics_data, etag, base in group:
+                    if offline.is_set():
+                        break
+                    collection = self.collection_for(event_href)
+                    if etag is None:
+                        # After a merge the ops behind it were made on the local version
+                        # only, the old ETag makes them go through the merge as well
+                        etag = stale if stale is not None else collection.store.etag(event_href) or ''
+                    try:
+                        new_etag, new_data, conflicts = self.write_op(collection, event_href, ics_data, etag, base)
+                    except requests.exceptions.HTTPError as e:
+                        if e.response.status_code not in REFUSED_STATUS:
+                            held.append(f"HTTP {e.response.status_code}")
+                            offline.set()
+                            break
+                        # Refused: the claimed ops of this href are dropped
+                        for unsent_seq in unsent:
+                            self.oplog.end(unsent_seq, True)
+                        unsent = []
+                        return sent, (event_href, e)
+                    except requests.exceptions.RequestException:
+                        offline.set()
+                        break
+                    if new_data is None:
+                        collection.store.delete(event_href)
+                    else:
+                        collection.store.put(event_href, new_etag, new_data)
+                    self.oplog.end(seq, True)
+                    unsent.remove(seq)
+                    stale = etag if conflicts is not None else None
+                    sent.append((event_href, new_data, new_etag, conflicts))
+                return sent, None
+            finally:
+                for unsent_seq in unsent:
+                    self.oplog.end(unsent_seq, False)
+
+        def job():
+            groups = {}
+            for op in self.oplog.claim():
+                groups.setdefault(op[1], []).append(op)
+            return run_bulk(
+                list(groups.values()),
+                send,
+                max_workers=self.dav.pool_size,
+                progress=lambda done, total: self.worker.report(f"{label} {done}/{total} tasks..."))
+
+        def on_done(results):
+            if not results:
+                return
+            failures = []
+            notes = []
+            done = 0
+            merged = False
+            unconfirmed = False
+            for group, result, error in results:
+                sent, failure = result if error is None else ([], (group[0][1], error))
+                for event_href, ics_data, etag, conflicts in sent:
+                    done += 1
+                    if conflicts is not None:
+                        # Merged with a newer server copy, shown as the server has it now
+                        self.load_index(self.collection_for(event_href), [event_href])
+                        merged = True
+                        if conflicts:
+                            summaries = ", ".join(self.get_task_summary_by_uid(uid) for uid in self.index.uids_by_href.get(event_href, ()))
+                            if conflicts == [DELETE_CONFLICT]:
+                                notes.append(f"{summaries}: edited elsewhere, not deleted")
+                            else:
+                                notes.append(f"{summaries}: kept the server's {', '.join(conflicts).lower()}")
+                    if ics_data is not None:
+                        # Without an ETag the server may have altered the data
+                        self.index.set_etag(event_href, etag)
+                        unconfirmed |= not etag
+                if failure is not None:
+                    failures.append(failure)
+            if failures:
+                for event_href, _ in failures:
+                    self.load_index(self.collection_for(event_href), [event_href])
+            if failures or merged:
+                self.update_task_list()
+            if notes:
+                error_dialog(self.window, "Changed on the server meanwhile:\n" + "\n".join(notes))
+            if failures:
+                details = "\n".join(str(e) for _, e in failures[:10])
+                more = f"\n... and {len(failures) - 10} more" if len(failures) > 10 else ""
+                error_dialog(self.window, f"{len(failures)} changes were refused by the server:\n{details}{more}")
+            if offline.is_set():
+                reason = f"Server answered {held[0]}" if held else "Offline"
+                self.window.status_bar.push(0, f"{reason}: {len(self.oplog)} changes will be sent when the server is back")
+                self.schedule_write_retry()
+            else:
+                self.write_retry_delay = WRITE_RETRY_MIN
+                self.window.status_bar.push(0, f"{label} done: {done} ok, {len(failures)} failed")
+            for collection in {self.collection_for(group[0][1]) for group, _, _ in results}:
+                collection.save_snapshot(self.index.resources(collection.name))
+            if failures or unconfirmed:
+                self.start_async_fetch()
+        self.worker.submit(job, on_done=on_done, status=f"{label} changes...")
+
+    ### ONE QUEUED OP AGAINST THE SERVER
+    # Returns (etag, data, conflicts) of what the server holds afterwards, data None
+    # when the resource is gone and conflicts None unless a 412 led to a merge.
+    # A DELETE of something already gone counts as done
+    def write_op(self, collection, href, data, etag, base):
+        import requests
         try:
-            event_url = urljoin(server_base, event_href)
-            response = requests.put(
-                event_url,
-                headers={'Content-Type': 'text/calendar; charset=utf-8'},
-                auth=HTTPBasicAuth(self.user, self.api_key),
-                data=cal.to_ical()
-            )
-            response.raise_for_status()
-        except Exception as e:
-            raise Exception(f"API error: {str(e)}")
-        
-        self.start_async_fetch()
-
+            if data is None:
+                collection.dav.delete(href, etag)
+                return None, None, None
+            response = collection.dav.put(href, data, etag)
+            return response.headers.get('ETag', ''), data, None
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code
+            if data is None and status in (404, 410):
+                return None, None, None
+            if status != 412:
+                raise
+            return self.resolve_conflict(collection, href, data, base, e)
+
+    ### 412: THE SERVER COPY MOVED SINCE THE CHANGE WAS MADE
+    # Only that resource is fetched again, never the calendar. A PUT is merged field
+    # by field with it and retried; an edit of something deleted elsewhere recreates
+    # it. A DELETE is not sent over the other client's edit, the task stays and the
+    # conflict is reported. Raises error when the copies can't be merged, or the
+    # last 412 when the resource keeps moving
+    def resolve_conflict(self, collection, href, data, base, error):
+        import requests
+        from .merge import merge
+        for _ in range(CONFLICT_RETRIES):
+            current = collection.dav.get(href)
+            if current is None:
+                if data is None:
+                    return None, None, []
+                etag, merged, conflicts = '', data, []
+            else:
+                etag, remote = current
+                if data is None:
+                    return etag, remote, [DELETE_CONFLICT]
+                merged, conflicts = merge(base, data, remote)
+                if merged is None:
+                    raise error
+                if merged is remote:
+                    # Nothing left to send, e.g. an earlier attempt did land
+                    return etag, remote, conflicts
+            try:
+                response = collection.dav.put(href, merged, etag)
+                return response.headers.get('ETag', ''), merged, conflicts
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code != 412:
+                    raise
+                error = e
+        raise error
+
+    def schedule_write_retry(self):
+        if self.write_retry is not None:
+            return
+        delay = self.write_retry_delay
+        self.write_retry_delay = min(delay * 2, WRITE_RETRY_MAX)
 
+        def retry():
+            self.write_retry = None
+            if len(self.oplog):
+                self.flush_writes()
+            return False
+        self.write_retry = GLib.timeout_add_seconds(delay, retry)
 
     ### ADD BUTTON STACK HANDLER
     def stack_handler(self, action):
@@ -383,59 +513,18 @@ class Application(Gtk.Application):
             self.window.status_bar.push(0, status)
 
     ### GET SELECTION FROM COLUMNVIEW
+    # Always a fresh list: reusing self.uid let stale UIDs pile up across calls
     def get_selection(self):
-        if not isinstance(self.uid, list):
-            self.uid = [self.uid]
-            self.uid.clear()
+        uids = []
         selection = self.window.column_view.get_model()  
         bitset = selection.get_selection()  
         for i in range(bitset.get_size()):
             index = bitset.get_nth(i) 
-            item = selection.get_item(index)
-            if item:
-                self.uid.append(item.uid) 
-        return self.uid
+            row = selection.get_item(index)
+            if row:
+                uids.append(row.get_item().uid) 
+        return uids
 
-    ### HREF EXTRACT 
-    def extract_uid_to_href(self):
-        try:
-            tree = ET.parse(self.ics_file)
-        except ET.ParseError as e:
-            raise ValueError(f"Failed to parse XML file: {e}")
-    
-        root = tree.getroot()
-        namespaces = {
-            'd': 'DAV:',
-            'cal': 'urn:ietf:params:xml:ns:caldav'
-        }
-        uid_to_href = {}
-
-        for response in root.findall('d:response', namespaces):
-            href_element = response.find('d:href', namespaces)
-            if href_element is None:
-                continue
-            href = href_element.text.strip()
-
-            propstat = response.find('d:propstat', namespaces)
-            if propstat is None:
-                continue
-            prop = propstat.find('d:prop', namespaces)
-            if prop is None:
-                continue
-            calendar_data_element = prop.find('cal:calendar-data', namespaces)
-            if calendar_data_element is None or not calendar_data_element.text:
-                continue
-
-            uid_in_cal = None
-            for line in calendar_data_element.text.splitlines():
-                line = line.strip()
-                if line.startswith('UID:'):
-                    uid_in_cal = line.split(':', 1)[1].strip()
-                    break
-            if uid_in_cal:
-                uid_to_href[uid_in_cal] = href
-        return uid_to_href
-    
     ###RESET INPUT FIELDS
     def reset_input(self, *_):
         try:
@@ -452,14 +541,14 @@ class Application(Gtk.Application):
 
     ### LOAD UP ENV AND CHECK FOR MISSING, IF SOMETHING MISSING TRIGGER SETUP
     def load_environment_vars(self):
+        from dotenv import load_dotenv
         env_path = os.path.join(os.path.dirname(__file__), '.env')
         load_dotenv(env_path)
-        def check_missing_env(base_url, user, api_key, calendar, root_dir):
+        def check_missing_env(base_url, user, api_key, root_dir):
             required = {
                 "BASE_URL": base_url,
                 "USERNAME": user,
                 "API_KEY": api_key,
-                "CALENDAR": calendar,
                 "ROOT_DIR": root_dir
             }
             missing = [var for var, val in required.items() if not val]
@@ -468,20 +557,50 @@ class Application(Gtk.Application):
         self.base_url = os.getenv("BASE_URL")
         self.user = os.getenv("USERNAME")
         self.api_key = os.getenv("API_KEY")
-        self.calendar = os.getenv("CALENDAR")
+        # Optional: comma separated calendars to show, every task list when unset
+        self.calendar = os.getenv("CALENDAR", "")
         self.root_dir = os.getenv("ROOT_DIR", os.path.expanduser("~/.config/nctasks_gtk"))
+        # Optional: query (default, completed tasks filtered server side), propfind or get
+        self.fetch_method = os.getenv("FETCH_METHOD", "query").lower()
+        # Optional: seconds between background change checks, off when unset or 0
+        try:
+            self.auto_refresh = int(os.getenv("AUTO_REFRESH", "0") or 0)
+        except ValueError:
+            self.auto_refresh = 0
         # Check for missing variables
-        missing = check_missing_env(self.base_url,self.user,self.api_key,self.calendar,self.root_dir)
+        missing = check_missing_env(self.base_url,self.user,self.api_key,self.root_dir)
         if missing:
             if self.window.get_mapped():
                 setup_dialog(missing,parent=self.window,refresh_callback=self.load_environment_vars)
         else:
-            # TODO: This is the new url building for the radicale caldav server
-            self.cal_url = f"{self.base_url}/{self.user}/{self.calendar}"
-            # TODO: Nextcloud url building here
-            # self.cal_url = f"{self.base_url}/remote.php/dav/calendars/{self.user}/{self.calendar}"
-            self.ics_file = os.path.join(self.root_dir, 'tasks')
+            from .dav import DavClient
+            if hasattr(self, 'dav'):
+                self.dav.close()
+            # One session for discovery and every calendar, discovery starts at BASE_URL
+            self.dav = DavClient(self.base_url.rstrip('/'), self.user, self.api_key)
+            self.calendar_names = [name.strip() for name in self.calendar.split(',') if name.strip()]
+            self.calendar_list_file = os.path.join(self.root_dir, 'calendars.json')
+            self.collections = {}
+            self.index = TaskIndex()
+            # Changes not yet on the server, from this run or an earlier one
+            self.oplog = OpLog(os.path.join(self.root_dir, 'oplog.db'))
+            # Calendars found last time, so the cache shows before any discovery and a
+            # sync only lists the calendar home again
+            self.calendar_listing = load_calendar_list(self.calendar_list_file)
+            self.dav.home_url = self.calendar_listing['home_url']
+            self.set_collections(self.build_collections(self.calendar_listing['calendars']))
+            # Show the last synced copy first, then revalidate against the server
+            self.load_cached()
             self.start_async_fetch()           
+            if self.refresh is not None:
+                self.refresh.stop()
+                self.refresh = None
+            if self.auto_refresh > 0:
+                from .scheduler import RefreshScheduler
+                self.refresh = RefreshScheduler(self.poll_calendars, self.start_async_fetch, self.auto_refresh)
+                self.refresh.set_focused(self.window.is_active())
+                self.refresh.start()
+        return False
             
     ### HANDLE SETUP DIALOG VALUES
     def handle_setup_response(self, url, user, api_key, calendar, root_dir, refresh_callback):
@@ -494,214 +613,248 @@ USERNAME="{user}"
 API_KEY="{api_key}"
 CALENDAR="{calendar}"
 ROOT_DIR="{root_dir}"
+FETCH_METHOD="{os.getenv('FETCH_METHOD', 'query')}"
+AUTO_REFRESH="{os.getenv('AUTO_REFRESH', '')}"
         '''
         with open(env_path, 'w') as env_file:
             env_file.write(env_content)
         refresh_callback()
 
-    ### ASYNC FETCH
+    ### CALENDARS -> CalendarCollections, ANY THREAD
+    # calendars as returned by DavClient.discover; collections already open for
+    # the same URL are reused, so their stores and loaded state carry over
+    def build_collections(self, calendars):
+        collections = {}
+        for calendar in select_calendars(calendars, self.calendar_names):
+            collection = self.collections.get(calendar['name'])
+            if collection is None or collection.dav.cal_url != calendar['url']:
+                collection = CalendarCollection(
+                    calendar['name'],
+                    self.dav.for_collection(calendar['url']),
+                    self.root_dir,
+                    calendar['display_name'])
+            collections[calendar['name']] = collection
+        return collections
+
+    ### SWAP IN A NEW SET OF CALENDARS, GTK THREAD
+    def set_collections(self, collections):
+        removed = [name for name in self.collections if name not in collections]
+        self.collections = collections
+        # New tasks go to the first calendar
+        self.default_collection = next(iter(collections.values()), None)
+        for name in removed:
+            self.index.remove_collection(name)
+        if removed:
+            self.update_task_list()
+        return False
+
+    ### CALENDARS ON THE SERVER
+    # One PROPFIND of the calendar home found last time; full discovery only when
+    # there is none or it fails, and on servers without discovery the CALENDAR names
+    # under the user's collection. Returns (calendars, versions), versions mapping
+    # each name to the ctag (or sync-token) just reported, '' when unknown. Auth and
+    # server errors are raised, the cached list is only replaced by a good answer
+    def discover_calendars(self):
+        import requests
+        from .dav import MethodUnsupported
+        calendars = None
+        discovery = self.calendar_listing['discovery']
+        if self.dav.home_url:
+            try:
+                calendars = self.dav.list_calendars(self.dav.home_url)
+            except (MethodUnsupported, requests.exceptions.HTTPError) as e:
+                print(f"Listing {self.dav.home_url} failed: {e}, discovering again")
+                self.dav.home_url = None
+        if calendars is None and discovery:
+            try:
+                calendars = self.dav.discover()
+            except MethodUnsupported as e:
+                print(f"{e}, using CALENDAR")
+                discovery = False
+        if calendars is None:
+            if not self.calendar_names:
+                raise MethodUnsupported("The server doesn't support calendar discovery, set CALENDAR to the calendars to use")
+            # TODO: This is the new url building for the radicale caldav server
+            home_url = f"{self.base_url.rstrip('/')}/{self.user}"
+            # TODO: Nextcloud url building here
+            # home_url = f"{self.base_url}/remote.php/dav/calendars/{self.user}"
+            calendars = [dict(name=name, url=f"{home_url}/{name}", display_name=name, ctag='', sync_token='')
+                         for name in self.calendar_names]
+            # Same version poll_calendars compares against, read per calendar
+            for calendar in calendars:
+                try:
+                    calendar['ctag'] = self.dav.for_collection(calendar['url']).get_version()
+                except (requests.exceptions.RequestException, MethodUnsupported) as e:
+                    print(f"No ctag for {calendar['name']}: {e}")
+        listing = calendar_list(calendars, self.dav.home_url, discovery)
+        if listing != self.calendar_listing:
+            self.calendar_listing = listing
+            try:
+                save_calendar_list(self.calendar_list_file, listing)
+            except OSError as e:
+                print(f"Failed to write calendar list: {e}")
+        return calendars, {calendar['name']: calendar['ctag'] or calendar['sync_token'] for calendar in calendars}
+
+    ### BACKGROUND CHANGE CHECK, RUNS ON THE SCHEDULER'S THREAD
+    # Only ctags are read: one PROPFIND of the calendar home when discovery worked,
+    # otherwise a Depth 0 PROPFIND per calendar. True when a fetch is needed; a
+    # calendar that reports no version is left alone so the scheduler backs off
+    def poll_calendars(self):
+        if self.worker.busy:
+            return False
+        collections = list(self.collections.values())
+        if self.dav.home_url:
+            calendars = select_calendars(self.dav.list_calendars(self.dav.home_url), self.calendar_names)
+            if {calendar['name'] for calendar in calendars} != {collection.name for collection in collections}:
+                return True
+            versions = {calendar['name']: calendar['ctag'] or calendar['sync_token'] for calendar in calendars}
+        else:
+            versions = {collection.name: collection.dav.get_version() for collection in collections}
+        for collection in collections:
+            version = versions.get(collection.name, '')
+            if version and not collection.unchanged(version):
+                return True
+        return False
+
+    def on_focus_changed(self, window, _):
+        if self.refresh is not None:
+            self.refresh.set_focused(window.is_active())
+
+    ### CALENDAR A RESOURCE BELONGS TO, BY ITS HREF
+    def collection_for(self, href):
+        for collection in self.collections.values():
+            if collection.owns(href):
+                return collection
+        return self.default_collection
+
+    ### COLD START FROM DISK, BEFORE ANY NETWORK I/O
+    # Queued ahead of the first fetch, every calendar from its snapshot or store
+    def load_cached(self):
+        collections = list(self.collections.values())
+
+        def read_cache():
+            return [(collection, collection.read_cache()) for collection in collections]
+
+        def on_done(cached):
+            for collection, resources in cached:
+                if resources:
+                    self.window.stale_label.set_visible(True)
+                    self.update_calendar_data(collection, None, resources, snapshot=False)
+        self.worker.submit(read_cache, on_done=on_done, status="Loading cached tasks...")
+
+    ### ASYNC FETCH, QUEUED CHANGES GO OUT FIRST
     def start_async_fetch(self):
-        self.set_ui_state(busy=True, status="Connecting to DAV server...")
-        threading.Thread(target=self.fetch_caldav_data, daemon=True).start()
+        if len(self.oplog):
+            self.flush_writes()
+
+        def on_done(synced):
+            if synced:
+                self.window.stale_label.set_visible(False)
+            self.set_ui_state(self.worker.busy, ("Last sync at " + datetime.now().strftime("%H:%M")))
+        self.worker.submit(self.fetch_caldav_data, on_done=on_done, status="Connecting to DAV server...")
 
     ### FETCHING
+    # One discovery PROPFIND lists every calendar with its ctag, those whose ctag
+    # matches the one their store was synced at are not fetched at all. The others
+    # are synced concurrently over the shared connection pool, each one hands its
+    # parsed changes to the GTK thread as soon as it is done, so a slow calendar
+    # doesn't hold back the others
     def fetch_caldav_data(self):
+        import requests
+        from .dav import MethodUnsupported
         try:
-            print(self.cal_url)
-            print(self.user)
-            print(self.api_key)
-            # TODO: New fetch for the radicale caldav server
-            response = requests.request(
-                method='GET',
-                url=self.cal_url,
-                headers={
-                    'Depth': '1',
-                },
-                auth=HTTPBasicAuth(self.user, self.api_key),
-                timeout=10 
-            )
-            # #TODO: Nextcloud call here
-            # response = requests.request(
-            #     method='PROPFIND',
-            #     url=self.cal_url,
-            #     headers={
-            #         'Depth': '1',
-            #         'Content-Type': 'application/xml'
-            #     },
-            #     auth=HTTPBasicAuth(self.user, self.api_key),
-            #     data='''<?xml version="1.0" encoding="UTF-8"?>
-            #         <d:propfind xmlns:d="DAV:" xmlns:cal="urn:ietf:params:xml:ns:caldav">
-            #             <d:prop>
-            #                 <d:getetag/>
-            #                 <cal:calendar-data/>
-            #             </d:prop>
-            #         </d:propfind>''',
-            #     timeout=10 
-            # )
-            # Check if the response is valid
-            response.raise_for_status()
-            # Log status and content type for debugging
-            try:
-                print(f"DAV GET status: {response.status_code}")
-                print(f"DAV GET content-type: {response.headers.get('Content-Type', '')}")
-            except Exception:
-                pass
-            # Accept common content types from DAV servers
-            # e.g., 'text/calendar', 'application/xml', 'text/xml', 'application/calendar+json'
-            # Don't block on strict type; just ensure we received some content
-            if not response.content:
-                raise ValueError("Empty response body from server.")
-            # Save received data
-            os.makedirs(os.path.dirname(self.ics_file), exist_ok=True)
-            with open(self.ics_file, 'wb') as f:
-                f.write(response.content)
-            # Update UI with fresh data
-            GLib.idle_add(self.update_calendar_data)
-        except requests.exceptions.RequestException as e:
-            error_message = f"Sync failed: {str(e)}"
-            GLib.idle_add(error_dialog, error_message)
-        except Exception as e:
-            error_message = f"Unexpected error: {str(e)}"
-            GLib.idle_add(error_dialog, error_message)
-        finally:
-            GLib.idle_add(self.set_ui_state, False, ("Last sync at " + datetime.now().strftime("%H:%M")))
+            calendars, versions = self.discover_calendars()
+        except (requests.exceptions.RequestException, MethodUnsupported) as e:
+            GLib.idle_add(error_dialog, self.window, f"Calendar discovery failed: {str(e)}")
+            return False
+        collections = self.build_collections(calendars)
+        if collections.keys() != self.collections.keys() or any(
+                collection is not self.collections.get(name) for name, collection in collections.items()):
+            GLib.idle_add(self.set_collections, collections)
+        if not collections:
+            GLib.idle_add(error_dialog, self.window, "No task lists found on the server")
+            return False
+
+        def fetch(collection):
+            version = versions.get(collection.name, '')
+            if collection.unchanged(version):
+                # Same ctag as last sync, the store is current
+                touched = set()
+            else:
+                touched = collection.sync(self.fetch_method)
+                collection.ctag = version
+            # Parse what the store reports as changed here, the GTK thread only
+            # swaps the ready records into the index
+            if not collection.loaded:
+                GLib.idle_add(self.update_calendar_data, collection, None, parse_resources(collection.store.load()))
+                collection.loaded = True
+            elif touched:
+                GLib.idle_add(self.update_calendar_data, collection, touched, parse_resources(collection.store.load(touched)))
+
+        results = run_bulk(list(collections.values()), fetch, max_workers=self.dav.pool_size)
+        errors = []
+        for collection, _, e in results:
+            if isinstance(e, requests.exceptions.RequestException):
+                errors.append(f"Sync of {collection.display_name} failed: {str(e)}")
+            elif e is not None:
+                errors.append(f"Unexpected error in {collection.display_name}: {str(e)}")
+        if errors:
+            GLib.idle_add(error_dialog, self.window, "\n".join(errors))
+        return not errors
 
     ### LOAD NEW DATA AND UPDATE UI
-    def update_calendar_data(self):
-        self.cal = self.load_or_create_calendar()
+    def update_calendar_data(self, collection, touched=None, parsed=None, snapshot=True):
+        self.load_index(collection, touched, parsed)
         self.update_task_list()
-
-    ### LOAD THE .ICS INTO MEMORY
-    def load_or_create_calendar(self):
-        cal = Calendar()
-        cal.add('prodid', '-//NCTasks//mxm.dk//')
-        cal.add('version', '2.0')
-        if not os.path.exists(self.ics_file):
-            return cal
-        try:
-            # Parse XML and extract calendar data
-            tree = ET.parse(self.ics_file)
-            root = tree.getroot()
-            
-            # XML namespaces
-            namespaces = {
-                'd': 'DAV:',
-                'cal': 'urn:ietf:params:xml:ns:caldav'
-            }
-            # Find all successful responses with calendar data
-            for response in root.findall('.//d:response', namespaces):
-                status = response.find('.//d:status', namespaces)
-                if status is None or '200 OK' not in status.text:
-                    continue
-                calendar_data = response.find('.//cal:calendar-data', namespaces)
-                if calendar_data is None:
-                    continue
-                # Parse iCalendar content
-                ical_content = calendar_data.text.strip()
-                try:
-                    sub_cal = Calendar.from_ical(ical_content)
-                    for component in sub_cal.walk():
-                        if component.name == 'VTODO':
-                            cal.add_component(component)
-                except Exception as e:
-                    print(f"Error parsing iCalendar content: {e}")
-            return cal
-        except Exception as e:
-            print(f"Error loading calendar data: {e}")
-            return cal
-
-    def update_task_list(self):
-        priority_map = {1: 'High', 5: 'Medium', 9: 'Low'}
-        priority_sort_order = {'High': 3, 'Medium': 2, 'Low': 1, 'Not Set': 0}
-        status_map = {'IN-PROCESS': 'Started', 'NEEDS-ACTION': 'Todo', 'COMPLETED': 'Completed'}
-
-        self.task_list.remove_all()
-
-        tasks_by_uid = {}
-        parent_to_children = {}
-        roots = []
-
-        # Parse all VTODO components
-        for component in self.cal.walk():
-            if component.name != 'VTODO':
+        if snapshot:
+            collection.save_snapshot(self.index.resources(collection.name))
+
+    ### LOAD A CALENDAR'S STORED RESOURCES INTO THE TASK INDEX
+    # touched None replaces everything of that calendar, otherwise only those hrefs.
+    # parsed holds (href, etag, data, records) already produced by parse_resources
+    def load_index(self, collection, touched=None, parsed=None):
+        if touched is None:
+            self.index.remove_collection(collection.name)
+        else:
+            for href in touched:
+                self.index.remove_resource(href)
+        if parsed is None:
+            parsed = parse_resources(collection.store.load(touched))
+        for href, etag, data, records in parsed:
+            self.index.set_resource(href, etag, data, records, collection=collection.name)
+        # Changes still in the op log win over the server copy
+        for seq, href, data, etag, base in self.oplog.pending():
+            if not collection.owns(href) or (touched is not None and href not in touched):
                 continue
+            if data is None:
+                self.index.remove_resource(href)
+            else:
+                if etag is None:
+                    etag = collection.store.etag(href) or ''
+                self.index.set_resource(href, etag, data, collection=collection.name)
 
-            try:
-                uid = str(component.get('uid', ''))
-                task = str(component.get('summary', 'Untitled Task'))
-                description = str(component.get('description', ''))
-                priority_val = int(component.get('priority', '9999'))
-                priority = priority_map.get(priority_val, 'Not Set')
-                status_val = str(component.get('status', 'None'))
-                status = status_map.get(status_val, 'None')
-
-                if status == 'Completed':
-                    continue
-
-                due = component.get('due')
-                if due:
-                    if isinstance(due, str):
-                        due_date = datetime.strptime(due, '%Y%m%dT%H%M%S') if 'T' in due else datetime.strptime(due, '%Y%m%d')
-                    else:
-                        due_date = due.dt
-                        if isinstance(due_date, date) and not isinstance(due_date, datetime):
-                            due_date = datetime.combine(due_date, datetime.min.time(), timezone.utc)
-                        elif due_date.tzinfo is None:
-                            due_date = due_date.replace(tzinfo=timezone.utc)
-                    due_str = due_date.strftime('󰥔  %a %d/%m %H:%M')
-                else:
-                    due_date = datetime.max.replace(tzinfo=timezone.utc)
-                    due_str = 'Not Set'
-
-                related_to = str(component.get('related-to', ''))
-
-                task_info = (uid, task, description, priority, status, due_str, due_date, related_to)
-                tasks_by_uid[uid] = task_info
-
-                if related_to:
-                    parent_to_children.setdefault(related_to, []).append(uid)
-                else:
-                    roots.append(uid)
-
-            except Exception as e:
-                print(f"Error parsing task: {e}")
-
-        # Collapse all parents on first load
-        if self.first_load:
-            self.collapsed_parents = set(parent_to_children.keys())
-            self.first_load = False
-
-        # Recursive insertion
-        def insert_task(uid, level):
-            if uid not in tasks_by_uid:
-                return
-
-            task, name, description, priority, status, due_str, due_date, _ = tasks_by_uid[uid]
-            indent = "  " * level + ("󰳟   " if level > 0 else "")
-            is_parent = uid in parent_to_children
-            is_collapsed = uid in self.collapsed_parents
-            task_obj = TaskObject(uid=task, task=f"{indent}{name}", description=description, priority=priority, status=status, due=due_str)
-            task_obj.is_parent = is_parent
-            task_obj.is_collapsed = is_collapsed
-            self.task_list.append(task_obj)
-
-            if is_parent and is_collapsed:
-                return  # Don't show children if collapsed
-
-            children = parent_to_children.get(uid, [])
-            children.sort(key=lambda cid: (tasks_by_uid[cid][6], -priority_sort_order[tasks_by_uid[cid][3]]))
-            for child_uid in children:
-                insert_task(child_uid, level + 1)
-
-        # Sort roots and begin recursion
-        roots.sort(key=lambda uid: (tasks_by_uid[uid][6], -priority_sort_order[tasks_by_uid[uid][3]]))
-        for root_uid in roots:
-            insert_task(root_uid, 0)
-
-    def toggle_collapse(self, uid):
-        if uid in self.collapsed_parents:
-            self.collapsed_parents.remove(uid)
-        else:
-            self.collapsed_parents.add(uid)
-        self.update_task_list()
-    
\ No newline at end of file
+    ### REBUILD THE ROWS OFF THE GTK THREAD
+    # The index is snapshotted here, a builder thread turns it into row fields and
+    # apply_view hands them to the task model, GTK sorts and nests them
+    def update_task_list(self):
+        self.view_generation += 1
+        generation = self.view_generation
+        records = self.index.records()
+        expanded = set(self.task_model.expanded)
+
+        def build():
+            GLib.idle_add(self.apply_view, generation, build_rows(records, expanded))
+        threading.Thread(target=build, daemon=True).start()
+
+    def apply_view(self, generation, rows):
+        # A newer build is on its way
+        if generation != self.view_generation:
+            return False
+        self.task_model.update(rows)
+        if self.profile is not None and rows:
+            self.profile.rows_placed(self.window, len(rows))
+        return False
+
+    ### EXPAND/COLLAPSE, HANDLED BY THE TREE MODEL
+    def toggle_collapse(self, position):
+        self.task_model.toggle(position)
@@ -0,0 +1,157 @@
+from urllib.parse import urlparse, unquote
+from .store import TaskStore, is_completed, load_snapshot, save_snapshot
+from .vtodo import parse_resources
+import threading
+import json
+import os
+import re
+
+
+### FILE NAME FOR A COLLECTION'S LOCAL CACHE
+def cache_name(name):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', name) or '_'
+
+
+### DISCOVERED CALENDARS, CACHED SO NEITHER A COLD START NOR A SYNC REDISCOVERS
+# calendars is what DavClient.discover returns, home_url the calendar home it
+# found and discovery False on servers that don't support it. The ctag of each
+# calendar is kept in its own store, next to the sync-token
+CALENDAR_FIELDS = ('name', 'url', 'display_name')
+
+
+def calendar_list(calendars, home_url=None, discovery=True):
+    return dict(
+        home_url=home_url,
+        discovery=discovery,
+        calendars=[{field: calendar[field] for field in CALENDAR_FIELDS} for calendar in calendars])
+
+
+def save_calendar_list(path, listing):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(listing, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_calendar_list(path):
+    try:
+        with open(path) as f:
+            listing = json.load(f)
+    except FileNotFoundError:
+        return calendar_list([])
+    except (OSError, ValueError) as e:
+        print(f"Ignoring calendar list: {e}")
+        return calendar_list([])
+    if isinstance(listing, list):
+        # Written before the calendar home was kept
+        return calendar_list(listing)
+    return calendar_list(listing.get('calendars', []), listing.get('home_url'), listing.get('discovery', True))
+
+
+### CALENDARS TO SHOW: ALL OF THEM, OR THOSE NAMED IN CALENDAR IN THAT ORDER
+# Names match the last path segment or the display name
+def select_calendars(calendars, names):
+    if not names:
+        return calendars
+    selected = []
+    for name in names:
+        for calendar in calendars:
+            if name in (calendar['name'], calendar['display_name']) and calendar not in selected:
+                selected.append(calendar)
+    return selected
+
+
+### ONE CALDAV COLLECTION: ITS CLIENT, LOCAL STORE AND SNAPSHOT
+# Every collection keeps its own sqlite store and snapshot under root_dir/calendars,
+# the DavClients of all collections share one session and connection pool
+class CalendarCollection:
+    def __init__(self, name, dav, root_dir, display_name=None):
+        self.name = name
+        self.display_name = display_name or name
+        self.dav = dav
+        # Hrefs of the collection's members all start with its path, compared unquoted
+        self.href_prefix = unquote(urlparse(dav.cal_url).path).rstrip('/') + '/'
+        cache = os.path.join(root_dir, 'calendars', cache_name(name))
+        self.store = TaskStore(cache + '.db')
+        self.snapshot_file = cache + '.snapshot'
+        self.loaded = False  # Set by the worker once the index has been fed a full load
+        self.snapshot_serial = 0
+        self.snapshot_lock = threading.Lock()
+
+    def owns(self, href):
+        return unquote(href).startswith(self.href_prefix)
+
+    ### CTAG (OR SYNC-TOKEN) THE STORE WAS LAST SYNCED AT
+    @property
+    def ctag(self):
+        return self.store.get_meta('ctag')
+
+    @ctag.setter
+    def ctag(self, ctag):
+        self.store.set_meta('ctag', ctag or '')
+
+    # True when the server reports the version the store already holds
+    def unchanged(self, version):
+        return bool(version) and version == self.ctag
+
+    ### COLD START: THE SNAPSHOT WHEN IT MATCHES THE STORE, OTHERWISE THE STORE
+    # Returns (href, etag, data, records) without touching the network. The raw
+    # data comes from the store either way, the snapshot only saves the parsing
+    def read_cache(self):
+        snapshot = load_snapshot(self.snapshot_file)
+        if snapshot is not None and snapshot['generation'] == self.store.generation:
+            datas = {href: data for href, uid, etag, data in self.store.load()}
+            # Tasks only known locally come back from the op log
+            resources = [(href, etag, datas[href], records)
+                         for href, etag, records in snapshot['resources'] if href in datas]
+        else:
+            resources = parse_resources(self.store.load())
+        self.loaded = bool(resources)
+        return resources
+
+    ### SYNC THE STORE WITH THE SERVER, RETURNS THE TOUCHED HREFS
+    # Incremental sync-collection when a token is known, otherwise a full fetch with
+    # fetch_method. The token is read before the full fetch so changes made
+    # meanwhile show up again in the next delta instead of being lost
+    def sync(self, fetch_method):
+        from .dav import SyncTokenRejected, MethodUnsupported
+        token = self.store.sync_token
+        full = True
+        if token:
+            try:
+                reader = self.dav.sync_collection(token)
+                full = False
+            except (SyncTokenRejected, MethodUnsupported) as e:
+                print(f"{self.display_name}: {e}, falling back to full fetch")
+        if full:
+            token = self.dav.get_sync_token()
+            reader, method = self.dav.fetch_all(fetch_method)
+            print(f"{self.display_name}: full fetch with {method}")
+        items = iter(reader)
+        if fetch_method == 'query':
+            # Same rule on full fetches and deltas: whatever the query leaves out (a
+            # COMPLETED date) is dropped here too, along with STATUS:COMPLETED
+            items = ((href, etag, None if data is not None and is_completed(data) else data) for href, etag, data in items)
+        # Resources stream from the socket into the store one at a time
+        touched = self.store.apply(items, full=full)
+        self.store.sync_token = token if full else reader.sync_token
+        return touched
+
+    ### WRITE THE PARSED RESOURCES FOR THE NEXT COLD START
+    # Pickled on a thread; if several are in flight only the newest one writes. One
+    # that never made it (the app quit first) is older than the store and ignored
+    def save_snapshot(self, resources):
+        self.snapshot_serial += 1
+        serial = self.snapshot_serial
+        generation = self.store.generation
+        resources = [(href, etag, records) for href, etag, data, records in resources]
+
+        def write():
+            with self.snapshot_lock:
+                if serial != self.snapshot_serial:
+                    return
+                try:
+                    save_snapshot(self.snapshot_file, resources, generation)
+                except Exception as e:
+                    print(f"Failed to write snapshot of {self.display_name}: {e}")
+        threading.Thread(target=write, daemon=True).start()
@@ -0,0 +1,462 @@
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse, urljoin, unquote
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+import requests
+
+NAMESPACES = {
+    'd': 'DAV:',
+    'cal': 'urn:ietf:params:xml:ns:caldav',
+    'cs': 'http://calendarserver.org/ns/'
+}
+
+### RFC 6578 SYNC-COLLECTION BODY
+SYNC_COLLECTION_BODY = '''<?xml version="1.0" encoding="UTF-8"?>
+<d:sync-collection xmlns:d="DAV:" xmlns:cal="urn:ietf:params:xml:ns:caldav">
+    <d:sync-token>{token}</d:sync-token>
+    <d:sync-level>1</d:sync-level>
+    <d:prop>
+        <d:getetag/>
+        <cal:calendar-data/>
+    </d:prop>
+</d:sync-collection>'''
+
+### RFC 4791 CALENDAR-QUERY BODY, VTODOS NOT MARKED DONE WITH A COMPLETED DATE
+# Filtering on STATUS would also drop VTODOs without any STATUS, a prop-filter
+# only matches defined properties. store.is_completed applies this same rule
+# plus STATUS:COMPLETED in CalendarCollection.sync, on full and incremental
+# syncs alike, so both keep the same tasks
+CALENDAR_QUERY_BODY = '''<?xml version="1.0" encoding="UTF-8"?>
+<cal:calendar-query xmlns:d="DAV:" xmlns:cal="urn:ietf:params:xml:ns:caldav">
+    <d:prop>
+        <d:getetag/>
+        <cal:calendar-data/>
+    </d:prop>
+    <cal:filter>
+        <cal:comp-filter name="VCALENDAR">
+            <cal:comp-filter name="VTODO">
+                <cal:prop-filter name="COMPLETED">
+                    <cal:is-not-defined/>
+                </cal:prop-filter>
+            </cal:comp-filter>
+        </cal:comp-filter>
+    </cal:filter>
+</cal:calendar-query>'''
+
+PROPFIND_DATA_BODY = '''<?xml version="1.0" encoding="UTF-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:cal="urn:ietf:params:xml:ns:caldav">
+    <d:prop>
+        <d:getetag/>
+        <cal:calendar-data/>
+    </d:prop>
+</d:propfind>'''
+
+PROPFIND_SYNC_TOKEN_BODY = '''<?xml version="1.0" encoding="UTF-8"?>
+<d:propfind xmlns:d="DAV:">
+    <d:prop>
+        <d:sync-token/>
+    </d:prop>
+</d:propfind>'''
+
+### DISCOVERY (RFC 6764 / RFC 4791): PRINCIPAL -> CALENDAR HOME -> COLLECTIONS
+PROPFIND_PRINCIPAL_BODY = '''<?xml version="1.0" encoding="UTF-8"?>
+<d:propfind xmlns:d="DAV:">
+    <d:prop>
+        <d:current-user-principal/>
+    </d:prop>
+</d:propfind>'''
+
+PROPFIND_HOME_SET_BODY = '''<?xml version="1.0" encoding="UTF-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:cal="urn:ietf:params:xml:ns:caldav">
+    <d:prop>
+        <cal:calendar-home-set/>
+    </d:prop>
+</d:propfind>'''
+
+# getctag and sync-token tell whether a collection changed without reading it
+PROPFIND_CALENDARS_BODY = '''<?xml version="1.0" encoding="UTF-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:cal="urn:ietf:params:xml:ns:caldav" xmlns:cs="http://calendarserver.org/ns/">
+    <d:prop>
+        <d:resourcetype/>
+        <d:displayname/>
+        <cs:getctag/>
+        <d:sync-token/>
+        <cal:supported-calendar-component-set/>
+    </d:prop>
+</d:propfind>'''
+
+PROPFIND_VERSION_BODY = '''<?xml version="1.0" encoding="UTF-8"?>
+<d:propfind xmlns:d="DAV:" xmlns:cs="http://calendarserver.org/ns/">
+    <d:prop>
+        <cs:getctag/>
+        <d:sync-token/>
+    </d:prop>
+</d:propfind>'''
+
+### FULL FETCH METHODS, EACH FALLS BACK TO THE NEXT ONE WHEN UNSUPPORTED
+FETCH_METHODS = ('query', 'propfind', 'get')
+
+# Status codes meaning "this server does not do that request"
+UNSUPPORTED_STATUS = (400, 403, 404, 405, 415, 501)
+
+
+class SyncTokenRejected(Exception):
+    pass
+
+
+class MethodUnsupported(Exception):
+    pass
+
+
+### STREAMING MULTISTATUS PARSING
+RESPONSE_TAG = f"{{{NAMESPACES['d']}}}response"
+SYNC_TOKEN_TAG = f"{{{NAMESPACES['d']}}}sync-token"
+CHUNK_SIZE = 64 * 1024
+
+
+# One <d:response> -> (href, etag, calendar-data), calendar-data None when the
+# member was removed; None for responses without usable data
+def parse_response(response):
+    href = response.findtext('d:href', '', NAMESPACES).strip()
+    if not href:
+        return None
+    # A removed member carries its status directly on <d:response>
+    status = response.findtext('d:status', '', NAMESPACES)
+    if '404' in status:
+        return href, None, None
+    for propstat in response.findall('d:propstat', NAMESPACES):
+        if '200' not in propstat.findtext('d:status', '', NAMESPACES):
+            continue
+        calendar_data = propstat.findtext('d:prop/cal:calendar-data', '', NAMESPACES)
+        if not calendar_data:
+            continue
+        etag = propstat.findtext('d:prop/d:getetag', '', NAMESPACES).strip()
+        return href, etag, calendar_data.strip()
+    return None
+
+
+# Iterates (href, etag, calendar-data) over a multistatus body fed in chunks,
+# dropping each <d:response> once read so memory stays flat whatever the size.
+# sync_token is set once iteration reaches it
+class MultistatusReader:
+    def __init__(self, chunks, on_close=None):
+        self.chunks = chunks
+        self.on_close = on_close
+        self.sync_token = ''
+
+    def __iter__(self):
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        parents = []
+        received = False
+        try:
+            for chunk in self.chunks:
+                if not chunk:
+                    continue
+                received = True
+                parser.feed(chunk)
+                yield from self._drain(parser, parents)
+            if not received:
+                raise ValueError("Empty response body from server.")
+            parser.close()
+            yield from self._drain(parser, parents)
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    def _drain(self, parser, parents):
+        for event, element in parser.read_events():
+            if event == 'start':
+                parents.append(element)
+                continue
+            parents.pop()
+            if element.tag == RESPONSE_TAG:
+                item = parse_response(element)
+                if parents:
+                    parents[-1].remove(element)
+                if item is not None:
+                    yield item
+            elif element.tag == SYNC_TOKEN_TAG and element.text:
+                self.sync_token = element.text.strip()
+
+
+### SHARED DAV CLIENT
+# One pooled keep-alive session for all DAV traffic, with retries and a single timeout
+class DavClient:
+    RETRY_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'PROPFIND', 'REPORT'})
+
+    def __init__(self, cal_url, user=None, api_key=None, timeout=10, pool_size=8, retries=3, session=None):
+        self.cal_url = cal_url
+        parsed_cal_url = urlparse(cal_url)
+        self.server_base = f"{parsed_cal_url.scheme}://{parsed_cal_url.netloc}"
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.home_url = None  # Calendar home, known once discover() succeeded
+        if session is not None:
+            # Another client's session, connections are pooled across collections
+            self.session = session
+            return
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(user, api_key)
+        # Back off on transient server errors, never on 4xx which carry meaning for DAV
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=self.RETRY_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    ### CLIENT FOR ANOTHER COLLECTION ON THE SAME SESSION
+    def for_collection(self, cal_url):
+        return DavClient(cal_url, timeout=self.timeout, pool_size=self.pool_size, session=self.session)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    ### HREF <-> URL
+    def url_for(self, href):
+        return urljoin(self.server_base, href)
+
+    def href_for(self, uid):
+        return urlparse(f"{self.cal_url}/{uid}.ics").path
+
+    ### SINGLE RESOURCE READ, FOR CONFLICT RESOLUTION
+    # Returns (etag, data), or None when the resource is gone
+    def get(self, href):
+        response = self.request('GET', self.url_for(href))
+        if response.status_code in (404, 410):
+            return None
+        response.raise_for_status()
+        return response.headers.get('ETag', ''), response.content
+
+    ### SINGLE RESOURCE WRITES
+    # With an etag the write only applies to that version of the resource, with ''
+    # only if the resource doesn't exist yet; a mismatch is a 412
+    def put(self, href, data, etag=None):
+        headers = {'Content-Type': 'text/calendar; charset=utf-8'}
+        if etag:
+            headers['If-Match'] = etag
+        elif etag == '':
+            headers['If-None-Match'] = '*'
+        response = self.request('PUT', self.url_for(href), headers=headers, data=data)
+        response.raise_for_status()
+        return response
+
+    def delete(self, href, etag=None):
+        headers = {'If-Match': etag} if etag else {}
+        response = self.request('DELETE', self.url_for(href), headers=headers)
+        response.raise_for_status()
+        return response
+
+    ### STREAM A MULTISTATUS BODY, THE CONNECTION IS RELEASED ONCE READ
+    def stream_multistatus(self, response):
+        return MultistatusReader(response.iter_content(CHUNK_SIZE), on_close=response.close)
+
+    def fail(self, response, error):
+        response.close()
+        raise error
+
+    ### SYNC-COLLECTION REPORT
+    # Returns a MultistatusReader over the changes since token, removed members
+    # come with calendar-data None; reader.sync_token is the new token once read
+    def sync_collection(self, token):
+        response = self.request(
+            'REPORT',
+            self.cal_url,
+            headers={
+                'Depth': '0',
+                'Content-Type': 'application/xml; charset=utf-8'
+            },
+            data=SYNC_COLLECTION_BODY.format(token=token or ''),
+            stream=True
+        )
+        # Servers answer a stale/unknown token with 403/409 (valid-sync-token precondition) or 400
+        if token and response.status_code in (400, 403, 409, 410, 412):
+            self.fail(response, SyncTokenRejected(f"Server rejected sync-token ({response.status_code})"))
+        if response.status_code in UNSUPPORTED_STATUS:
+            self.fail(response, MethodUnsupported(f"sync-collection not supported ({response.status_code})"))
+        if not response.ok:
+            response.close()
+            response.raise_for_status()
+        return self.stream_multistatus(response)
+
+    ### CURRENT SYNC-TOKEN OF THE COLLECTION, '' WHEN THE SERVER HAS NONE
+    def get_sync_token(self):
+        response = self.request(
+            'PROPFIND',
+            self.cal_url,
+            headers={
+                'Depth': '0',
+                'Content-Type': 'application/xml; charset=utf-8'
+            },
+            data=PROPFIND_SYNC_TOKEN_BODY
+        )
+        if response.status_code in UNSUPPORTED_STATUS:
+            return ''
+        response.raise_for_status()
+        root = ET.fromstring(response.content)
+        token = root.findtext('.//d:sync-token', '', NAMESPACES)
+        return token.strip()
+
+    ### FULL FETCH
+    # Returns (reader, method): a MultistatusReader over (href, etag, calendar-data)
+    # and the method that actually answered
+    def fetch_all(self, method='query'):
+        if method not in FETCH_METHODS:
+            method = FETCH_METHODS[0]
+        fetchers = {
+            'query': self.calendar_query,
+            'propfind': self.propfind_collection,
+            'get': self.get_collection
+        }
+        for candidate in FETCH_METHODS[FETCH_METHODS.index(method):]:
+            try:
+                return fetchers[candidate](), candidate
+            except MethodUnsupported as e:
+                print(f"{e}, falling back")
+        raise MethodUnsupported("No supported fetch method")
+
+    ### CALENDAR-QUERY REPORT, COMPLETED TASKS ARE FILTERED SERVER SIDE
+    def calendar_query(self):
+        return self.multistatus_request('REPORT', CALENDAR_QUERY_BODY)
+
+    ### DEPTH 1 PROPFIND WITH CALENDAR DATA (NEXTCLOUD)
+    def propfind_collection(self):
+        return self.multistatus_request('PROPFIND', PROPFIND_DATA_BODY)
+
+    def multistatus_request(self, method, body):
+        response = self.request(
+            method,
+            self.cal_url,
+            headers={
+                'Depth': '1',
+                'Content-Type': 'application/xml; charset=utf-8'
+            },
+            data=body,
+            stream=True
+        )
+        if response.status_code in UNSUPPORTED_STATUS:
+            self.fail(response, MethodUnsupported(f"{method} not supported ({response.status_code})"))
+        if not response.ok:
+            response.close()
+            response.raise_for_status()
+        return self.stream_multistatus(response)
+
+    ### PLAIN DEPTH 1 GET (RADICALE)
+    def get_collection(self):
+        # TODO: New fetch for the radicale caldav server
+        response = self.request(
+            'GET',
+            self.cal_url,
+            headers={
+                'Depth': '1',
+            },
+            stream=True
+        )
+        # Nextcloud: see propfind_collection
+        if response.status_code in UNSUPPORTED_STATUS:
+            self.fail(response, MethodUnsupported(f"GET not supported ({response.status_code})"))
+        # Check if the response is valid
+        if not response.ok:
+            response.close()
+            response.raise_for_status()
+        # Log status and content type for debugging
+        try:
+            print(f"DAV GET status: {response.status_code}")
+            print(f"DAV GET content-type: {response.headers.get('Content-Type', '')}")
+        except Exception:
+            pass
+        # Accept common content types from DAV servers
+        # e.g., 'text/calendar', 'application/xml', 'text/xml', 'application/calendar+json'
+        # Don't block on strict type; the reader raises on an empty body
+        return self.stream_multistatus(response)
+
+    ### PROPFIND -> PARSED MULTISTATUS
+    def propfind(self, url, body, depth='0'):
+        response = self.request(
+            'PROPFIND',
+            url,
+            headers={
+                'Depth': depth,
+                'Content-Type': 'application/xml; charset=utf-8'
+            },
+            data=body
+        )
+        if response.status_code in UNSUPPORTED_STATUS:
+            raise MethodUnsupported(f"PROPFIND on {url} not supported ({response.status_code})")
+        response.raise_for_status()
+        try:
+            return ET.fromstring(response.content)
+        except ET.ParseError as e:
+            raise MethodUnsupported(f"Unreadable PROPFIND answer from {url}: {e}")
+
+    # URL of the <d:href> inside the property prop, e.g. 'd:current-user-principal'
+    def href_property(self, url, body, prop):
+        root = self.propfind(url, body)
+        href = root.findtext(f'.//{prop}/d:href', '', NAMESPACES).strip()
+        if not href:
+            raise MethodUnsupported(f"No {prop} at {url}")
+        return urljoin(url, href)
+
+    ### CALENDAR DISCOVERY
+    # Principal -> calendar-home-set -> every collection that takes VTODOs. Starts
+    # at cal_url and falls back to /.well-known/caldav. Returns a list of
+    # dict(name, url, display_name, ctag, sync_token), name being the last path segment.
+    # Only "not supported" answers count as a server without discovery; auth and
+    # server errors are raised as they are
+    def discover(self):
+        error = None
+        for start_url in (self.cal_url, urljoin(self.server_base, '/.well-known/caldav')):
+            try:
+                principal = self.href_property(start_url, PROPFIND_PRINCIPAL_BODY, 'd:current-user-principal')
+                break
+            except MethodUnsupported as e:
+                error = e
+        else:
+            raise MethodUnsupported(f"Calendar discovery failed: {error}")
+        home = self.href_property(principal, PROPFIND_HOME_SET_BODY, 'cal:calendar-home-set')
+        calendars = self.list_calendars(home)
+        # Polling lists the home again, one request for the ctags of every calendar
+        self.home_url = home
+        return calendars
+
+    def list_calendars(self, home_url):
+        root = self.propfind(home_url, PROPFIND_CALENDARS_BODY, depth='1')
+        calendars = []
+        for response in root.findall('d:response', NAMESPACES):
+            href = response.findtext('d:href', '', NAMESPACES).strip()
+            props = None
+            for propstat in response.findall('d:propstat', NAMESPACES):
+                if ' 200 ' in propstat.findtext('d:status', '', NAMESPACES):
+                    props = propstat.find('d:prop', NAMESPACES)
+            if not href or props is None or props.find('d:resourcetype/cal:calendar', NAMESPACES) is None:
+                continue
+            # Without a component set the collection takes every component type
+            components = props.find('cal:supported-calendar-component-set', NAMESPACES)
+            if components is not None and len(components):
+                names = {comp.get('name', '').upper() for comp in components.findall('cal:comp', NAMESPACES)}
+                if 'VTODO' not in names:
+                    continue
+            name = unquote(href.rstrip('/').rsplit('/', 1)[-1])
+            calendars.append(dict(
+                name=name,
+                url=urljoin(home_url, href).rstrip('/'),
+                display_name=(props.findtext('d:displayname', '', NAMESPACES) or '').strip() or name,
+                ctag=(props.findtext('cs:getctag', '', NAMESPACES) or '').strip(),
+                sync_token=(props.findtext('d:sync-token', '', NAMESPACES) or '').strip()
+            ))
+        return calendars
+
+    ### CTAG OF THE COLLECTION, ITS SYNC-TOKEN WHEN IT HAS NONE, ELSE ''
+    def get_version(self):
+        root = self.propfind(self.cal_url, PROPFIND_VERSION_BODY)
+        ctag = root.findtext('.//cs:getctag', '', NAMESPACES) or root.findtext('.//d:sync-token', '', NAMESPACES)
+        return (ctag or '').strip()
@@ -1,13 +1,7 @@
 from gi import require_versions
 require_versions({"Gtk": "4.0", "Adw": "1"})
 from gi.repository import Gtk, Gdk
-from datetime import datetime, timezone, date
-from icalendar import vDatetime
-from requests.auth import HTTPBasicAuth
-from icalendar import Calendar
-import webbrowser
 import os
-from dotenv import load_dotenv
 
 
 def on_due_date_clicked(button, due_button, stack, date_label):
@@ -120,10 +114,10 @@ def setup_dialog(missing, parent, refresh_callback):
     # Calendar            
     calendar_entry = Gtk.Entry(hexpand=True,halign=Gtk.Align.FILL,xalign=0.5)
     if "CALENDAR" not in missing:
-        calendar_entry.set_text(os.getenv("CALENDAR"))
+        calendar_entry.set_text(os.getenv("CALENDAR", ""))
     else:     
-        calendar_entry.set_placeholder_text("lower case only")
-    calendar_label = Gtk.Label(label="The calendar fetched to get tasks,only lower case")
+        calendar_entry.set_placeholder_text("optional, all task lists when empty")
+    calendar_label = Gtk.Label(label="The calendars fetched to get tasks, comma separated")
     calendar_entry.set_size_request(250, -1)
     grid.attach(calendar_label, 0, 4, 1, 1)
     grid.attach(calendar_entry, 1, 4, 1, 1)
@@ -150,6 +144,7 @@ def setup_dialog(missing, parent, refresh_callback):
                 root_dir_entry.get_text(),
                 refresh_callback)
         if response_id == Gtk.ResponseType.HELP:
+            import webbrowser
             webbrowser.open("https://github.com/sickmitch/nctasks_gtk")
         if response_id == Gtk.ResponseType.CANCEL:
             from .window import Window
@@ -0,0 +1,135 @@
+from .vtodo import parse_vtodos
+
+
+### ONE ENTRY PER VTODO
+# record holds the fast-parsed list fields; the full icalendar component is only
+# built from the raw resource data when something asks for it (editing)
+class TaskEntry:
+    __slots__ = ('uid', 'record', 'href', 'etag', 'parent', 'data', 'collection', '_component')
+
+    def __init__(self, uid, record, href, etag, data, collection=None):
+        self.uid = uid
+        self.record = record
+        self.href = href
+        self.etag = etag
+        self.parent = record.related_to or None
+        self.data = data
+        self.collection = collection  # Name of the calendar the task comes from
+        self._component = None
+
+    @property
+    def component(self):
+        if self._component is None:
+            from icalendar import Calendar
+            for component in Calendar.from_ical(self.data).walk('VTODO'):
+                if str(component.get('uid', '')) == self.uid:
+                    self._component = component
+        return self._component
+
+
+### IN-MEMORY TASK INDEX: UID -> RECORD, HREF, ETAG AND PARENT/CHILDREN
+# Tasks of every calendar are merged here, each resource remembers its collection
+class TaskIndex:
+    def __init__(self):
+        self.entries = {}
+        self.uids_by_href = {}
+        self.children_by_uid = {}
+        self.collection_by_href = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, uid):
+        return uid in self.entries
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    # Records are never mutated once indexed, a list of them can be handed to
+    # another thread while the index keeps changing
+    def records(self):
+        return [entry.record for entry in self.entries.values()]
+
+    # Same shape parse_resources returns, used for the cold start snapshot
+    def resources(self, collection=None):
+        resources = []
+        for href, uids in self.uids_by_href.items():
+            if collection is not None and self.collection_by_href.get(href) != collection:
+                continue
+            entries = [self.entries[uid] for uid in uids]
+            if entries:
+                resources.append((href, entries[0].etag, entries[0].data, [entry.record for entry in entries]))
+        return resources
+
+    ### LOOKUPS
+    def get(self, uid):
+        return self.entries.get(uid)
+
+    def record(self, uid):
+        entry = self.entries.get(uid)
+        return entry.record if entry else None
+
+    def component(self, uid):
+        entry = self.entries.get(uid)
+        return entry.component if entry else None
+
+    def href(self, uid):
+        entry = self.entries.get(uid)
+        return entry.href if entry else None
+
+    def etag(self, uid):
+        entry = self.entries.get(uid)
+        return entry.etag if entry else None
+
+    def children(self, uid):
+        return self.children_by_uid.get(uid, set())
+
+    def collection(self, uid):
+        entry = self.entries.get(uid)
+        return entry.collection if entry else None
+
+    ### MUTATIONS
+    # Replace everything known for a resource with the VTODOs in its raw data,
+    # records may be passed in when they were already parsed elsewhere. Without a
+    # collection the resource stays in the one it was in
+    def set_resource(self, href, etag, data, records=None, collection=None):
+        if collection is None:
+            collection = self.collection_by_href.get(href)
+        self.remove_resource(href)
+        uids = set()
+        if records is None:
+            records = parse_vtodos(data)
+        for record in records:
+            if not record.uid:
+                continue
+            entry = TaskEntry(record.uid, record, href, etag, data, collection)
+            self.entries[record.uid] = entry
+            if entry.parent:
+                self.children_by_uid.setdefault(entry.parent, set()).add(record.uid)
+            uids.add(record.uid)
+        self.uids_by_href[href] = uids
+        self.collection_by_href[href] = collection
+
+    def set_etag(self, href, etag):
+        for uid in self.uids_by_href.get(href, ()):
+            self.entries[uid].etag = etag
+
+    def remove_resource(self, href):
+        self.collection_by_href.pop(href, None)
+        for uid in self.uids_by_href.pop(href, ()):
+            entry = self.entries.pop(uid, None)
+            if entry and entry.parent:
+                siblings = self.children_by_uid.get(entry.parent)
+                if siblings is not None:
+                    siblings.discard(uid)
+                    if not siblings:
+                        del self.children_by_uid[entry.parent]
+
+    def remove(self, uid):
+        entry = self.entries.get(uid)
+        if entry:
+            self.remove_resource(entry.href)
+
+    def remove_collection(self, collection):
+        for href in [href for href, name in self.collection_by_href.items() if name == collection]:
+            self.remove_resource(href)
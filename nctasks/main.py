@@ -1,6 +1,16 @@
-from .application import Application
+# --profile-startup prints process start -> window mapped -> first rows rendered
+PROFILE_FLAG = '--profile-startup'
 
 
 def main(argv):
-    app = Application()
+    profile = None
+    if PROFILE_FLAG in argv:
+        # Gtk.Application rejects options it doesn't know
+        argv = [arg for arg in argv if arg != PROFILE_FLAG]
+        from .startup import StartupProfile
+        profile = StartupProfile()
+    from .application import Application
+    if profile is not None:
+        profile.mark("application imported")
+    app = Application(profile)
     app.run(argv)
@@ -0,0 +1,133 @@
+from datetime import datetime, timezone
+from .vtodo import unfold, split_property
+
+# Touched by every client on every write, never a reason to call it a conflict.
+# A merge that writes stamps them anew and moves SEQUENCE past both sides
+BOOKKEEPING = ('DTSTAMP', 'LAST-MODIFIED', 'SEQUENCE')
+# Pseudo property holding the nested components (VALARM), merged as one value
+COMPONENTS = 'BEGIN:'
+FOLD_OCTETS = 75
+
+
+### RAW CALENDAR DATA -> (LINES, START, END, FIELDS) OF ITS ONLY VTODO
+# fields maps property name -> tuple of content lines, in the order they appear.
+# None when there isn't exactly one VTODO (recurrence overrides, garbage)
+def split_vtodo(data):
+    lines = unfold(data)
+    starts = [i for i, line in enumerate(lines) if line.upper() == 'BEGIN:VTODO']
+    if len(starts) != 1:
+        return None
+    start = starts[0]
+    fields = {}
+    depth = 0
+    for end in range(start + 1, len(lines)):
+        line = lines[end]
+        upper = line.upper()
+        if depth == 0 and upper == 'END:VTODO':
+            return lines, start, end, {name: tuple(values) for name, values in fields.items()}
+        if upper.startswith('BEGIN:'):
+            depth += 1
+        if depth:
+            fields.setdefault(COMPONENTS, []).append(line)
+        else:
+            name, _, _ = split_property(line)
+            if name:
+                fields.setdefault(name, []).append(line)
+        if upper.startswith('END:'):
+            depth -= 1
+    return None
+
+
+# Same property written by two serializers: compared by name, params and value
+def normalized(lines):
+    if lines is None:
+        return None
+    out = []
+    for line in lines:
+        name, params, value = split_property(line)
+        out.append((name, tuple(sorted(params.items())), value) if name else line)
+    return tuple(out)
+
+
+def sequence(fields):
+    try:
+        return int(split_property(fields['SEQUENCE'][0])[2])
+    except (KeyError, ValueError):
+        return 0
+
+
+### CONTENT LINE FOLDING (RFC 5545 3.1), NEVER INSIDE A UTF-8 SEQUENCE
+def fold(line):
+    parts = []
+    current = ''
+    size = 0
+    for c in line:
+        octets = len(c.encode('utf-8'))
+        if size + octets > FOLD_OCTETS:
+            parts.append(current)
+            current = ' '
+            size = 1
+        current += c
+        size += octets
+    parts.append(current)
+    return '\r\n'.join(parts)
+
+
+### FIELD-LEVEL THREE-WAY MERGE OF A LOCAL EDIT WITH THE SERVER COPY
+# base is the version the local edit was made on (None when unknown, every
+# difference then counts as a conflict). A property changed on one side only
+# takes that side; changed on both sides differently, the server keeps it and its
+# name is reported. Returns (data, conflicts), data None when the resources can't
+# be merged field by field and remote itself when it already holds every change;
+# the result is laid out like the server copy
+def merge(base, local, remote):
+    local_split = split_vtodo(local)
+    remote_split = split_vtodo(remote)
+    base_fields = {}
+    if base is not None:
+        base_split = split_vtodo(base)
+        if base_split is None:
+            return None, []
+        base_fields = base_split[3]
+    if local_split is None or remote_split is None:
+        return None, []
+    local_fields = local_split[3]
+    lines, start, end, remote_fields = remote_split
+    local_uid, remote_uid = normalized(local_fields.get('UID')), normalized(remote_fields.get('UID'))
+    if local_uid != remote_uid:
+        return None, []
+    merged = {}
+    conflicts = []
+    for name in list(remote_fields) + [name for name in local_fields if name not in remote_fields]:
+        local_value = local_fields.get(name)
+        remote_value = remote_fields.get(name)
+        if name in BOOKKEEPING:
+            merged[name] = None  # Keeps its place, set below
+            continue
+        theirs, ours, original = normalized(remote_value), normalized(local_value), normalized(base_fields.get(name))
+        if ours == theirs or (base is not None and ours == original):
+            merged[name] = remote_value
+        elif base is not None and theirs == original:
+            merged[name] = local_value
+        else:
+            merged[name] = remote_value
+            conflicts.append(name)
+    if all(normalized(merged.get(name)) == normalized(remote_fields.get(name))
+           for name in set(merged) | set(remote_fields) if name not in BOOKKEEPING):
+        # The server copy already has every change, returned as is
+        return remote, conflicts
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    for name in BOOKKEEPING:
+        if name not in merged:
+            continue
+        if name == 'SEQUENCE':
+            merged[name] = (f"SEQUENCE:{max(sequence(local_fields), sequence(remote_fields)) + 1}",)
+        else:
+            merged[name] = (f"{name}:{stamp}",)
+    body = []
+    components = merged.pop(COMPONENTS, None) or ()
+    for values in merged.values():
+        body.extend(values or ())
+    body.extend(components)
+    out = lines[:start + 1] + body + lines[end:]
+    return ('\r\n'.join(fold(line) for line in out) + '\r\n').encode('utf-8'), conflicts
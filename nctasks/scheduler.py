@@ -0,0 +1,78 @@
+from gi.repository import GLib
+import threading
+import time
+
+
+### ADAPTIVE BACKGROUND REFRESH
+# poll() runs on its own thread and returns True when something changed on the
+# server, on_change() is then called on the GTK thread. The delay doubles after
+# every quiet poll up to max_interval and drops back to interval after a change;
+# while the window is unfocused it is stretched by unfocused_factor. There is
+# exactly one pending timer at a time and none while a poll is running.
+class RefreshScheduler:
+    def __init__(self, poll, on_change, interval=60, max_interval=1800, unfocused_factor=4):
+        self.poll = poll
+        self.on_change = on_change
+        self.interval = interval
+        self.max_interval = max(max_interval, interval)
+        self.unfocused_factor = unfocused_factor
+        self.delay = interval
+        self.focused = True
+        self.polling = False
+        self.running = False
+        self.source = None
+        self.last_poll = time.monotonic()
+
+    def start(self):
+        self.running = True
+        self._schedule()
+
+    def stop(self):
+        self.running = False
+        self._cancel()
+
+    ### WINDOW FOCUS, A LONG UNFOCUSED STRETCH IS CAUGHT UP ON RETURN
+    def set_focused(self, focused):
+        if focused == self.focused:
+            return
+        self.focused = focused
+        if self.running and not self.polling:
+            self._schedule()
+
+    def _cancel(self):
+        if self.source is not None:
+            GLib.source_remove(self.source)
+            self.source = None
+
+    def _schedule(self):
+        self._cancel()
+        delay = self.delay if self.focused else min(self.delay * self.unfocused_factor, self.max_interval * self.unfocused_factor)
+        remaining = max(0, delay - (time.monotonic() - self.last_poll))
+        # Second granularity lets GLib batch the wakeup with others
+        self.source = GLib.timeout_add_seconds(int(remaining + 0.5), self._fire)
+
+    def _fire(self):
+        self.source = None
+        self.polling = True
+        threading.Thread(target=self._poll, daemon=True).start()
+        return False
+
+    def _poll(self):
+        try:
+            changed = self.poll()
+        except Exception as e:
+            print(f"Background refresh check failed: {e}")
+            changed = False
+        GLib.idle_add(self._done, changed)
+
+    def _done(self, changed):
+        self.polling = False
+        self.last_poll = time.monotonic()
+        if changed:
+            self.delay = self.interval
+            self.on_change()
+        else:
+            self.delay = min(self.delay * 2, self.max_interval)
+        if self.running:
+            self._schedule()
+        return False
@@ -0,0 +1,76 @@
+import time
+import sys
+import os
+
+# Modules deferred until first use, reported if they were loaded before the first frame
+DEFERRED_MODULES = ('requests', 'icalendar', 'dotenv', 'xml.etree.ElementTree', 'webbrowser')
+
+
+### SECONDS SINCE BOOT, SAME CLOCK AS /proc/self/stat
+def now():
+    if hasattr(time, 'CLOCK_BOOTTIME'):
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+    return time.monotonic()
+
+
+### WHEN THE PROCESS STARTED, None WHERE /proc IS NOT AVAILABLE
+def process_start():
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may contain spaces, fields are counted after it
+            fields = f.read().rpartition(')')[2].split()
+        # starttime is field 22, in clock ticks since boot
+        return int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+### --profile-startup: PROCESS START -> WINDOW MAPPED -> FIRST ROWS RENDERED
+class StartupProfile:
+    def __init__(self):
+        self.start = process_start() if hasattr(time, 'CLOCK_BOOTTIME') else None
+        self.origin = "process start"
+        if self.start is None:
+            # Interpreter startup is not counted then
+            self.start = now()
+            self.origin = "main()"
+        self.marks = []
+        self.rows_seen = False
+        self.mark("main() entered")
+
+    def mark(self, label):
+        self.marks.append((label, now() - self.start))
+
+    ### WINDOW MAP, ALSO RECORDS WHICH DEFERRED MODULES WERE ALREADY LOADED
+    def watch(self, window):
+        def on_map(_):
+            self.mark("window mapped")
+            self.loaded_at_map = [name for name in DEFERRED_MODULES if name in sys.modules]
+        window.connect('map', on_map)
+
+    ### FIRST ROWS IN THE LIST, TIMED WHEN THE NEXT FRAME HAS BEEN PAINTED
+    def rows_placed(self, window, count):
+        if self.rows_seen:
+            return
+        self.rows_seen = True
+        self.mark(f"first rows in model ({count})")
+        clock = window.get_frame_clock()
+        if clock is None:
+            self.mark("first rows rendered")
+            self.report()
+            return
+
+        def on_paint(_):
+            clock.disconnect(handler)
+            self.mark("first rows rendered")
+            self.report()
+        handler = clock.connect('after-paint', on_paint)
+
+    def report(self):
+        print(f"Startup profile, milliseconds since {self.origin}:")
+        for label, elapsed in self.marks:
+            print(f"  {elapsed * 1000:8.1f}  {label}")
+        loaded = getattr(self, 'loaded_at_map', None)
+        if loaded:
+            print(f"  Loaded before the window was mapped: {', '.join(loaded)}")
+        sys.stdout.flush()
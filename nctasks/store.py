@@ -0,0 +1,263 @@
+import tempfile
+import sqlite3
+import threading
+import pickle
+import time
+import os
+
+# Bump whenever TaskRecord or the snapshot layout changes, old files are ignored
+SNAPSHOT_VERSION = 2
+
+
+### EXTRACT UID FROM RAW CALENDAR DATA WITHOUT A FULL PARSE
+def extract_uid(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', errors='replace')
+    in_todo = False
+    for line in data.splitlines():
+        line = line.strip()
+        if line == 'BEGIN:VTODO':
+            in_todo = True
+        elif in_todo and line.startswith('UID'):
+            name, _, value = line.partition(':')
+            if name.split(';', 1)[0] == 'UID':
+                return value.strip()
+    return None
+
+
+### TRUE WHEN THE VTODO IN RAW CALENDAR DATA IS COMPLETED
+# STATUS:COMPLETED or a COMPLETED date, the latter being what the calendar-query
+# filters on server side: full fetches and deltas then keep the same tasks
+def is_completed(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', errors='replace')
+    for line in data.splitlines():
+        name, _, value = line.strip().partition(':')
+        name = name.split(';', 1)[0]
+        if name == 'COMPLETED' or (name == 'STATUS' and value.strip() == 'COMPLETED'):
+            return True
+    return False
+
+
+### LOCAL OBJECT STORE, ONE ROW PER DAV RESOURCE KEYED BY HREF
+class TaskStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written from the fetch thread, read from the GTK thread
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS resources ("
+                "href TEXT PRIMARY KEY, uid TEXT, etag TEXT, data BLOB NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS resources_uid ON resources (uid)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    ### META (SYNC-TOKEN)
+    def get_meta(self, key, default=''):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def sync_token(self):
+        return self.get_meta('sync_token')
+
+    @sync_token.setter
+    def sync_token(self, token):
+        self.set_meta('sync_token', token or '')
+
+    # Bumped with every write that changes a row, local ones included
+    @property
+    def generation(self):
+        return int(self.get_meta('generation', '0'))
+
+    def _bump(self):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('generation', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    ### APPLY A DELTA: items yields (href, etag, data), data None meaning removed
+    # Items are written in batches so a streamed fetch never holds the lock across
+    # network reads. With full=True every resource not in items is dropped. Returns
+    # the set of hrefs whose content actually differs from what was stored
+    def apply(self, items, full=False, batch_size=200):
+        touched = set()
+        seen = set()
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self._write(batch, touched, seen)
+                batch = []
+        self._write(batch, touched, seen)
+        if full:
+            with self.lock, self.conn:
+                for (href,) in self.conn.execute("SELECT href FROM resources").fetchall():
+                    if href not in seen:
+                        self.conn.execute("DELETE FROM resources WHERE href = ?", (href,))
+                        touched.add(href)
+                        self._bump()
+        return touched
+
+    def _write(self, batch, touched, seen):
+        changed = len(touched)
+        with self.lock, self.conn:
+            for href, etag, data in batch:
+                seen.add(href)
+                row = self.conn.execute("SELECT etag FROM resources WHERE href = ?", (href,)).fetchone()
+                if data is None:
+                    if row is not None:
+                        self.conn.execute("DELETE FROM resources WHERE href = ?", (href,))
+                        touched.add(href)
+                    continue
+                # Same ETag means same bytes, nothing to rewrite or reparse
+                if etag and row is not None and row[0] == etag:
+                    continue
+                if isinstance(data, str):
+                    data = data.encode('utf-8')
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO resources (href, uid, etag, data) VALUES (?, ?, ?, ?)",
+                    (href, extract_uid(data), etag, data))
+                touched.add(href)
+            # Same transaction as the rows, a snapshot can't outlive them
+            if len(touched) != changed:
+                self._bump()
+
+    def put(self, href, etag, data):
+        return self.apply([(href, etag, data)])
+
+    def delete(self, href):
+        return self.apply([(href, None, None)])
+
+    ### READ BACK
+    def load(self, hrefs=None):
+        with self.lock:
+            if hrefs is None:
+                rows = self.conn.execute("SELECT href, uid, etag, data FROM resources").fetchall()
+            else:
+                rows = []
+                for href in hrefs:
+                    rows.extend(self.conn.execute(
+                        "SELECT href, uid, etag, data FROM resources WHERE href = ?", (href,)))
+        return rows
+
+    def etag(self, href):
+        with self.lock:
+            row = self.conn.execute("SELECT etag FROM resources WHERE href = ?", (href,)).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM resources").fetchone()[0]
+
+
+### DURABLE WRITE-AHEAD LOG OF LOCAL CHANGES NOT YET ON THE SERVER
+# One row per pending PUT (data) or DELETE (data NULL), replayed in seq order.
+# etag is the ETag the change was made on: '' for a resource the server doesn't
+# have yet, NULL to use whatever the store holds when the op is sent (an op
+# queued behind one that was already in flight for the same href). base is the
+# data the change was made on, for a three-way merge when the server refuses it
+class OpLog:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.inflight = set()  # seqs claimed by a replay, never coalesced into
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS ops ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, href TEXT NOT NULL, data BLOB, etag TEXT, created REAL)")
+            # Logs written before ops carried their base
+            if 'base' not in [row[1] for row in self.conn.execute("PRAGMA table_info(ops)")]:
+                self.conn.execute("ALTER TABLE ops ADD COLUMN base BLOB")
+
+    ### QUEUE A CHANGE, MERGED INTO A PENDING ONE FOR THE SAME HREF
+    # Consecutive edits become one PUT; deleting a resource that was only ever
+    # queued drops both
+    def append(self, href, data, etag, base=None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT seq, etag, data FROM ops WHERE href = ? ORDER BY seq DESC LIMIT 1", (href,)).fetchone()
+            if row is not None and row[0] not in self.inflight:
+                seq, base_etag, _ = row
+                if data is None and base_etag == '':
+                    self.conn.execute("DELETE FROM ops WHERE seq = ?", (seq,))
+                else:
+                    self.conn.execute("UPDATE ops SET data = ? WHERE seq = ?", (data, seq))
+                return
+            if row is not None:
+                # Made on what the op in flight is sending
+                etag, base = None, row[2]
+            self.conn.execute(
+                "INSERT INTO ops (href, data, etag, base, created) VALUES (?, ?, ?, ?, ?)",
+                (href, data, etag, base, time.time()))
+
+    # (seq, href, data, etag, base) in replay order
+    def pending(self):
+        with self.lock:
+            return self.conn.execute("SELECT seq, href, data, etag, base FROM ops ORDER BY seq").fetchall()
+
+    ### CLAIM EVERY OP NOT ALREADY BEING SENT, FOR ONE REPLAY
+    # Read and marked in flight under one lock: a change made after this point goes
+    # into a new op instead of one whose data has already been read. Every claimed
+    # op must be handed back with end()
+    def claim(self):
+        with self.lock:
+            ops = [op for op in self.conn.execute(
+                "SELECT seq, href, data, etag, base FROM ops ORDER BY seq").fetchall() if op[0] not in self.inflight]
+            self.inflight.update(op[0] for op in ops)
+        return ops
+
+    # sent True drops the op, False leaves it queued for the next replay
+    def end(self, seq, sent):
+        with self.lock, self.conn:
+            self.inflight.discard(seq)
+            if sent:
+                self.conn.execute("DELETE FROM ops WHERE seq = ?", (seq,))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM ops").fetchone()[0]
+
+
+### PARSED MODEL SNAPSHOT FOR INSTANT COLD START
+# resources are (href, etag, records), the raw data stays in the store only. The
+# store generation ties the snapshot to the store state it was taken from
+def save_snapshot(path, resources, generation):
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'saved': time.time(),
+        'generation': generation,
+        'resources': resources
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+# Returns the snapshot dict, or None when missing, unreadable or from another version
+def load_snapshot(path):
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring task snapshot: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    return snapshot
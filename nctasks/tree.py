@@ -0,0 +1,132 @@
+from datetime import datetime, time
+from functools import lru_cache
+from enum import IntEnum
+from html import escape
+
+PRIORITY_MAP = {1: 'High', 5: 'Medium', 9: 'Low'}
+PRIORITY_SORT_ORDER = {'High': 3, 'Medium': 2, 'Low': 1, 'Not Set': 0}
+CHILD_MARKER = "󰳟   "
+# Due timestamp of tasks without one, sorts after every real date
+NO_DUE = 2 ** 63 - 1
+
+
+### STATUS AS STORED ON THE ROW, LABELS ARE ONLY LOOKED UP ON BIND
+class Status(IntEnum):
+    NONE = 0
+    TODO = 1
+    STARTED = 2
+    COMPLETED = 3
+
+
+STATUS_MAP = {'NEEDS-ACTION': Status.TODO, 'IN-PROCESS': Status.STARTED, 'COMPLETED': Status.COMPLETED}
+STATUS_LABELS = ('None', 'Todo', 'Started', 'Completed')
+
+
+### DISPLAY FORMATTING, CALLED FROM THE CELL BIND
+def priority_label(priority):
+    return PRIORITY_MAP.get(priority, 'Not Set')
+
+
+# Higher sorts first among tasks due at the same time
+def priority_rank(priority):
+    return PRIORITY_SORT_ORDER[priority_label(priority)]
+
+
+def status_label(status):
+    return STATUS_LABELS[status]
+
+
+# Many rows share a due date, scrolling reuses the formatted string
+@lru_cache(maxsize=4096)
+def due_label(due):
+    if due == NO_DUE:
+        return 'Not Set'
+    return datetime.fromtimestamp(due).strftime('󰥔  %a %d/%m %H:%M')
+
+
+### DUE VALUE -> UNIX TIMESTAMP
+# Dates and floating times are local time, as RFC 5545 defines them
+def due_timestamp(due):
+    if due is None:
+        return NO_DUE
+    if not isinstance(due, datetime):
+        due = datetime.combine(due, time())
+    return int(due.timestamp())
+
+
+### PANGO MARKUP FOR THE TASK CELL, BUILT WITH THE ROW NOT ON BIND
+# High priority is bold, a collapsed parent underlined
+def summary_markup(prefix, name, high, collapsed):
+    markup = escape(name, quote=False)
+    if high:
+        markup = f'<b>{markup}</b>'
+    if collapsed:
+        markup = f'<u>{markup}</u>'
+    return prefix + markup
+
+
+def description_markup(description):
+    if not description:
+        return ''
+    return f'<span size="small" foreground="#888">{escape(description, quote=False)}</span>'
+
+
+### TaskRecords -> NATIVE FIELDS, COMPLETED TASKS LEFT OUT
+# Pure function of immutable records, safe to run off the GTK thread
+def build_tasks(records):
+    tasks = {}
+    for record in records:
+        try:
+            status = STATUS_MAP.get(record.status, Status.NONE)
+            if status == Status.COMPLETED:
+                continue
+            priority = record.priority or 0
+            due = due_timestamp(record.due)
+            tasks[record.uid] = dict(
+                name=record.summary if record.summary is not None else 'Untitled Task',
+                description=record.description or '',
+                priority=priority,
+                status=status,
+                due=due,
+                parent=record.related_to or ''
+            )
+        except Exception as e:
+            print(f"Error parsing task: {e}")
+    return tasks
+
+
+### RECORDS -> ROW FIELDS FOR EVERY TASK REACHABLE FROM A ROOT
+# Sorting and the parent/child layout are left to the GTK list models (see
+# window.TaskModel), a row only carries its parent uid and depth. expanded holds
+# the uids of the parents currently open, used for the collapsed underline
+def build_rows(records, expanded=()):
+    tasks = build_tasks(records)
+    children = {}
+    for uid, task in tasks.items():
+        if task['parent']:
+            children.setdefault(task['parent'], []).append(uid)
+    rows = {}
+    stack = [(uid, 0) for uid, task in tasks.items() if not task['parent']]
+    while stack:
+        uid, depth = stack.pop()
+        task = tasks[uid]
+        prefix = "  " * depth + (CHILD_MARKER if depth > 0 else "")
+        has_children = uid in children
+        collapsed = has_children and uid not in expanded
+        rows[uid] = dict(
+            uid=uid,
+            parent=task['parent'],
+            task=task['name'],
+            depth=depth,
+            prefix=prefix,
+            markup=summary_markup(prefix, task['name'], task['priority'] == 1, collapsed),
+            description_markup=description_markup(task['description']),
+            priority=task['priority'],
+            rank=priority_rank(task['priority']),
+            status=int(task['status']),
+            due=task['due'],
+            has_children=has_children,
+            collapsed=collapsed
+        )
+        stack.extend((child, depth + 1) for child in children.get(uid, ()))
+    return rows
@@ -0,0 +1,181 @@
+from datetime import datetime, date, timezone
+from zoneinfo import ZoneInfo
+import threading
+import os
+
+# Inline parsing takes ~15 us per resource; sending the records back from a worker
+# costs about a third of that and spawning the pool ~150 ms, so below this many
+# resources (~0.3 s of parsing) the pool doesn't pay off
+PARALLEL_THRESHOLD = 20000
+CHUNK_SIZE = 1000
+
+# One spawn pool for the whole process, created on first use, and one user at a time
+_pool = None
+_pool_lock = threading.Lock()
+
+
+### COMPACT RECORD OF THE FIELDS THE TASK LIST NEEDS
+class TaskRecord:
+    __slots__ = ('uid', 'summary', 'description', 'priority', 'status', 'due', 'related_to')
+
+    def __init__(self, uid='', summary=None, description=None, priority=None, status=None, due=None, related_to=None):
+        self.uid = uid
+        self.summary = summary
+        self.description = description
+        self.priority = priority
+        self.status = status
+        self.due = due
+        self.related_to = related_to
+
+    def __eq__(self, other):
+        return isinstance(other, TaskRecord) and all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        return "TaskRecord(" + ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__) + ")"
+
+
+### TEXT VALUE UNESCAPING (RFC 5545 3.3.11)
+def unescape_text(value):
+    if '\\' not in value:
+        return value
+    out = []
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c == '\\' and i + 1 < len(value):
+            n = value[i + 1]
+            out.append('\n' if n in 'nN' else n)
+            i += 2
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out)
+
+
+### PROPERTY LINE -> (NAME, PARAMS, VALUE)
+def split_property(line):
+    # The value starts at the first colon outside a quoted parameter value
+    quoted = False
+    for i, c in enumerate(line):
+        if c == '"':
+            quoted = not quoted
+        elif c == ':' and not quoted:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        return None, {}, ''
+    parts = head.split(';')
+    params = {}
+    for part in parts[1:]:
+        key, _, param_value = part.partition('=')
+        params[key.upper()] = param_value.strip('"')
+    return parts[0].upper(), params, value
+
+
+### DATE/DATE-TIME VALUE, SAME TYPES icalendar RETURNS FOR .dt
+def parse_date_value(value, params):
+    value = value.strip()
+    if params.get('VALUE', '').upper() == 'DATE' or len(value) == 8:
+        return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    dt = datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                  int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    if value.endswith('Z'):
+        return dt.replace(tzinfo=timezone.utc)
+    tzid = params.get('TZID')
+    if tzid:
+        try:
+            return dt.replace(tzinfo=ZoneInfo(tzid))
+        except (KeyError, ValueError):
+            # Non IANA names (custom VTIMEZONE) stay floating, like an unknown zone
+            pass
+    return dt
+
+
+### UNFOLDED CONTENT LINES
+def unfold(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', errors='replace')
+    lines = []
+    for line in data.splitlines():
+        if line[:1] in (' ', '\t') and lines:
+            lines[-1] += line[1:]
+        elif line:
+            lines.append(line)
+    return lines
+
+
+### FAST PATH: EVERY VTODO IN RAW CALENDAR DATA AS A TaskRecord
+# Only the fields the list shows are read; nested components (VALARM) are skipped.
+# The full icalendar object is built lazily, see TaskEntry.component
+def parse_vtodos(data):
+    records = []
+    record = None
+    depth = 0
+    for line in unfold(data):
+        upper = line.upper()
+        if upper.startswith('BEGIN:'):
+            if record is not None:
+                depth += 1
+            elif upper == 'BEGIN:VTODO':
+                record = TaskRecord()
+                depth = 0
+            continue
+        if upper.startswith('END:'):
+            if record is None:
+                continue
+            if depth:
+                depth -= 1
+            elif upper == 'END:VTODO':
+                records.append(record)
+                record = None
+            continue
+        if record is None or depth:
+            continue
+        name, params, value = split_property(line)
+        try:
+            if name == 'UID':
+                record.uid = value
+            elif name == 'SUMMARY':
+                record.summary = unescape_text(value)
+            elif name == 'DESCRIPTION':
+                record.description = unescape_text(value)
+            elif name == 'PRIORITY':
+                record.priority = int(value)
+            elif name == 'STATUS':
+                record.status = value.strip()
+            elif name == 'DUE':
+                record.due = parse_date_value(value, params)
+            elif name == 'RELATED-TO' and record.related_to is None:
+                if params.get('RELTYPE', 'PARENT').upper() == 'PARENT':
+                    record.related_to = value
+        except ValueError as e:
+            print(f"Error parsing {name} of task {record.uid}: {e}")
+    return records
+
+
+def parse_chunk(datas):
+    return [parse_vtodos(data) for data in datas]
+
+
+### PARSE STAGE: STORE ROWS (href, uid, etag, data) -> (href, etag, data, records)
+# Very large refreshes are parsed in chunks across the shared process pool; spawn
+# keeps the workers free of the GTK state a fork would copy. Calendars synced
+# concurrently don't queue for the pool, whoever finds it busy parses inline
+def parse_resources(rows):
+    global _pool
+    rows = list(rows)
+    if len(rows) < PARALLEL_THRESHOLD or (os.cpu_count() or 1) < 2 or not _pool_lock.acquire(blocking=False):
+        return [(href, etag, data, parse_vtodos(data)) for href, uid, etag, data in rows]
+    try:
+        if _pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            import atexit
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(_pool.shutdown)
+        datas = [data for href, uid, etag, data in rows]
+        chunks = [datas[i:i + CHUNK_SIZE] for i in range(0, len(datas), CHUNK_SIZE)]
+        records = [r for chunk in _pool.map(parse_chunk, chunks) for r in chunk]
+    finally:
+        _pool_lock.release()
+    return [(href, etag, data, recs) for (href, uid, etag, data), recs in zip(rows, records)]
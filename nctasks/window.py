@@ -1,18 +1,207 @@
 from gi import require_versions
 require_versions({"Gtk": "4.0", "Adw": "1"})
-from gi.repository import Gtk, Gdk, GObject, Gio, Pango, GLib
+from gi.repository import Gtk, Gdk, GObject, Gio, GLib, Pango
+from .tree import NO_DUE, priority_label, status_label, due_label, summary_markup
+from itertools import islice
 import os
-import re
 
-    # Create a custom list item class to hold task data
+# Rows created or moved per main loop iteration, a frame is never blocked for long
+ROW_BATCH = 500
+
+### ONE LIST ROW, NATIVE VALUES ONLY
+# priority is the iCalendar 0-9 value, status a tree.Status, due a unix timestamp
+# (NO_DUE when unset). Labels are formatted on bind, sorting and filtering
+# compare the numbers
 class TaskObject(GObject.Object):
     __gtype_name__ = 'TaskObject'
     uid = GObject.Property(type=str)
+    parent = GObject.Property(type=str)  # '' for top level tasks
     task = GObject.Property(type=str)
-    priority = GObject.Property(type=str)
-    status = GObject.Property(type=str)
-    due = GObject.Property(type=str)
-    description = GObject.Property(type=str)
+    depth = GObject.Property(type=int, default=0)
+    prefix = GObject.Property(type=str)  # Indentation and child marker
+    markup = GObject.Property(type=str)  # Escaped prefix + summary, ready for set_markup
+    description_markup = GObject.Property(type=str)
+    priority = GObject.Property(type=int, default=0)
+    rank = GObject.Property(type=int, default=0)  # Priority sort order, High highest
+    status = GObject.Property(type=int, default=0)
+    due = GObject.Property(type=GObject.TYPE_INT64, default=NO_DUE)
+    has_children = GObject.Property(type=bool, default=False)
+    collapsed = GObject.Property(type=bool, default=False)
+
+    # Set only the properties that differ, bound rows re-render on notify
+    def update(self, values):
+        self.freeze_notify()
+        try:
+            for name, value in values.items():
+                if self.get_property(name) != value:
+                    self.set_property(name, value)
+        finally:
+            self.thaw_notify()
+
+
+### TASK HIERARCHY AS GTK LIST MODELS
+# One Gio.ListStore of TaskObjects per parent uid ('' for the top level). Each
+# level is wrapped in a FilterListModel and a SortListModel, and a TreeListModel
+# creates the child level when a row is expanded, so sorting, filtering and
+# expand/collapse all run inside GTK. Sorting compares the native due and rank
+# properties with C-side sorters, no Python call per comparison; the uid breaks
+# ties so every row has one position a binary search can find.
+class TaskModel:
+    def __init__(self):
+        self.objects = {}  # uid -> TaskObject
+        self.stores = {'': Gio.ListStore(item_type=TaskObject)}
+        self.expanded = set()  # uids of open parents, survives model updates
+        self.pending = None  # Idle source applying the rest of an update
+        self.sorter = Gtk.MultiSorter()
+        self.sorter.append(Gtk.NumericSorter.new(Gtk.PropertyExpression.new(TaskObject, None, 'due')))
+        rank_sorter = Gtk.NumericSorter.new(Gtk.PropertyExpression.new(TaskObject, None, 'rank'))
+        rank_sorter.set_sort_order(Gtk.SortType.DESCENDING)
+        self.sorter.append(rank_sorter)
+        self.sorter.append(Gtk.StringSorter.new(Gtk.PropertyExpression.new(TaskObject, None, 'uid')))
+        # No filter function matches everything without calling into Python
+        self.filter = Gtk.CustomFilter.new(None)
+        self.root = self.level('')
+        self.tree = Gtk.TreeListModel.new(self.root, False, False, self.create_level)
+
+    def level(self, uid):
+        store = self.stores.setdefault(uid, Gio.ListStore(item_type=TaskObject))
+        filtered = Gtk.FilterListModel.new(store, self.filter)
+        return Gtk.SortListModel.new(filtered, self.sorter)
+
+    def create_level(self, item, *_):
+        return self.level(item.uid)
+
+    ### FILTERING, predicate(TaskObject) -> bool OR None FOR EVERYTHING
+    # A parent that is filtered out hides its children with it
+    def set_filter(self, predicate):
+        if predicate is None:
+            self.filter.set_filter_func(None)
+        else:
+            self.filter.set_filter_func(lambda item, *_: predicate(item))
+        self.restore_expanded()
+
+    ### APPLY rows (uid -> dict of TaskObject properties) IN PLACE
+    # Objects are reused by uid. One that changes parent or sort key is moved, so
+    # the sorted levels only see the rows that actually changed. ROW_BATCH rows are
+    # applied per main loop iteration, the first batch right away; a newer update
+    # takes over from an unfinished one, the objects it already placed are kept
+    def update(self, rows):
+        if self.pending is not None:
+            GLib.source_remove(self.pending)
+            self.pending = None
+        self.expanded &= rows.keys()
+        gone = [(uid, None) for uid in self.objects if uid not in rows]
+        changes = iter(gone + list(rows.items()))
+
+        def step():
+            batch = list(islice(changes, ROW_BATCH))
+            self.apply(batch)
+            if len(batch) == ROW_BATCH:
+                return True
+            self.pending = None
+            # Levels of parents that are gone
+            for parent in [uid for uid in self.stores if uid and uid not in self.objects]:
+                del self.stores[parent]
+            self.restore_expanded()
+            return False
+        if step():
+            self.pending = GLib.idle_add(step)
+
+    # (uid, row) pairs, row None for a task that is gone
+    def apply(self, batch):
+        removals = {}
+        additions = {}
+        for uid, row in batch:
+            if row is None:
+                obj = self.objects.pop(uid, None)
+                if obj is not None:
+                    removals.setdefault(obj.parent, []).append(obj)
+                continue
+            # The tree was built before the latest toggles, follow the current state
+            collapsed = row['has_children'] and uid not in self.expanded
+            if collapsed != row['collapsed']:
+                row = dict(row, collapsed=collapsed, markup=summary_markup(
+                    row['prefix'], row['task'], row['priority'] == 1, collapsed))
+            obj = self.objects.get(uid)
+            if obj is None:
+                obj = self.objects[uid] = TaskObject(**row)
+                additions.setdefault(obj.parent, []).append(obj)
+            elif obj.parent != row['parent'] or obj.due != row['due'] or obj.rank != row['rank']:
+                removals.setdefault(obj.parent, []).append(obj)
+                obj.update(row)
+                additions.setdefault(obj.parent, []).append(obj)
+            else:
+                obj.update(row)
+        for parent, objs in removals.items():
+            store = self.stores.get(parent)
+            if store is None:
+                continue
+            for obj in objs:
+                # Linear scan in C, the store is unsorted
+                found, position = store.find(obj)
+                if found:
+                    store.remove(position)
+        for parent, objs in additions.items():
+            store = self.stores.setdefault(parent, Gio.ListStore(item_type=TaskObject))
+            store.splice(store.get_n_items(), 0, objs)
+
+    ### EXPAND/COLLAPSE THE ROW AT position OF THE TREE MODEL
+    def toggle(self, position):
+        row = self.tree.get_row(position)
+        if row is None:
+            return
+        obj = row.get_item()
+        if not obj.has_children:
+            return
+        expanded = not row.get_expanded()
+        if expanded:
+            self.expanded.add(obj.uid)
+        else:
+            self.expanded.discard(obj.uid)
+        row.set_expanded(expanded)
+        obj.update(dict(collapsed=not expanded, markup=summary_markup(obj.prefix, obj.task, obj.priority == 1, not expanded)))
+
+    # A sorted level reports a changed span as removed and re-added, which drops
+    # the TreeListRows in it; open again whatever should be open. Only the rows of
+    # the expanded uids are looked up, parents before their children
+    def restore_expanded(self):
+        for uid in sorted(self.expanded, key=lambda uid: self.objects[uid].depth if uid in self.objects else 0):
+            obj = self.objects.get(uid)
+            row = self.row_for(obj) if obj is not None else None
+            if row is not None and not row.get_expanded():
+                row.set_expanded(True)
+
+    ### TreeListRow OF obj, None WHEN IT ISN'T SHOWN (FILTERED, PARENT CLOSED)
+    def row_for(self, obj):
+        if obj.parent:
+            parent = self.objects.get(obj.parent)
+            parent_row = self.row_for(parent) if parent is not None else None
+            if parent_row is None or not parent_row.get_expanded():
+                return None
+            position = self.position(parent_row.get_children(), obj)
+            return parent_row.get_child_row(position) if position is not None else None
+        position = self.position(self.root, obj)
+        return self.tree.get_child_row(position) if position is not None else None
+
+    # Binary search of a sorted level with the model's own sorter
+    def position(self, model, obj):
+        low, high = 0, model.get_n_items()
+        while low < high:
+            middle = (low + high) // 2
+            if self.sorter.compare(model.get_item(middle), obj) == Gtk.Ordering.SMALLER:
+                low = middle + 1
+            else:
+                high = middle
+        if low < model.get_n_items() and model.get_item(low) is obj:
+            return low
+        return None
+
+# Native row value -> text of the plain columns
+CELL_LABELS = {
+    'priority': priority_label,
+    'status': status_label,
+    'due': due_label
+}
 
 class Window(Gtk.ApplicationWindow):
     def __init__(self, app):
@@ -129,28 +318,27 @@ class Window(Gtk.ApplicationWindow):
         main_container.append(bottom_row)
         # Connect task_entry activate to add/edit
         self.task_entry.connect("activate", self.on_stack_clicked, self.add_stack)
-        self.initial_values = {
-            "task_entry": self.task_entry.get_text(),
-            "priority": self.priority_combo.get_active_text(),
-            "status": self.status_combo.get_active_text(),
-            "due": self.due_stack.get_visible_child_name(),
-        }
+        self.initial_values = self.input_values()
         self.state_changed = False
-        GLib.timeout_add(500, self.watch_for_changes)
-
-    def watch_for_changes(self):
-        current_values = {
+        # Dirty state is only recomputed when an input actually changes, no timer
+        self.task_entry.connect("changed", self.on_input_changed)
+        self.priority_combo.connect("changed", self.on_input_changed)
+        self.status_combo.connect("changed", self.on_input_changed)
+        self.due_stack.connect("notify::visible-child-name", self.on_input_changed)
+
+    def input_values(self):
+        return {
             "task_entry": self.task_entry.get_text(),
             "priority": self.priority_combo.get_active_text(),
             "status": self.status_combo.get_active_text(),
             "due": self.due_stack.get_visible_child_name(),
         }
-        if current_values != self.initial_values:
-            self.state_changed = True
-        else:
-            self.state_changed = False
-        self.reset_btn.set_visible(self.state_changed)
-        return True  # Keep the timer running
+
+    def on_input_changed(self, *_):
+        state_changed = self.input_values() != self.initial_values
+        if state_changed != self.state_changed:
+            self.state_changed = state_changed
+            self.reset_btn.set_visible(state_changed)
 
     def on_stack_clicked(self, widget, stack):
         active=stack.get_visible_child_name()
@@ -163,11 +351,12 @@ class Window(Gtk.ApplicationWindow):
 
     def create_task_list(self):
         self.scrolled_window = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
-        self.app.task_list = Gio.ListStore(item_type=TaskObject)
+        self.bindings = {}  # ListItem -> (TaskObject, notify handler ids)
+        self.app.task_model = TaskModel()
 
-        # Create ColumnView with multi-selection
+        # Create ColumnView with multi-selection, items are Gtk.TreeListRows
         self.column_view = Gtk.ColumnView(
-            model=Gtk.MultiSelection.new(self.app.task_list),
+            model=Gtk.MultiSelection.new(self.app.task_model.tree),
             show_row_separators=True,
             show_column_separators=True
         )
@@ -189,8 +378,9 @@ class Window(Gtk.ApplicationWindow):
 
             # Create factory for cell renderers
             factory = Gtk.SignalListItemFactory()
-            factory.connect("setup", self._on_factory_setup)
+            factory.connect("setup", self._on_factory_setup(property_name))
             factory.connect("bind", self._on_factory_bind(property_name))
+            factory.connect("unbind", self._on_factory_unbind)
 
             column.set_factory(factory)
             column.set_expand(expand)
@@ -206,60 +396,69 @@ class Window(Gtk.ApplicationWindow):
         self.scrolled_window.set_child(self.column_view)
         self.grid.attach(self.scrolled_window, 0, 1, 5, 1)
 
-    def _on_factory_setup(self, factory, list_item):
-        # Use a vertical box to show summary and description
-        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=0)
-        summary_label = Gtk.Label(xalign=0)
-        summary_label.set_ellipsize(Pango.EllipsizeMode.END)
-        summary_label.set_use_markup(True)
-        description_label = Gtk.Label(xalign=0)
-        description_label.set_ellipsize(Pango.EllipsizeMode.END)
-        description_label.set_use_markup(True)
-        description_label.get_style_context().add_class("dim-label")  # For lighter font
-        vbox.append(summary_label)
-        vbox.append(description_label)
-        list_item.set_child(vbox)
-
-    def _on_factory_bind(self, property_name):
-        def bind_handler(factory, list_item):
-            vbox = list_item.get_child()
-            summary_label = vbox.get_first_child()
-            description_label = vbox.get_last_child()
-            obj = list_item.get_item()
-            label_text = obj.get_property(property_name) or ""
-            description = obj.get_property("description") or ""
-
+    def _on_factory_setup(self, property_name):
+        def setup_handler(factory, list_item):
             if property_name == 'task':
-                match = re.match(r"(\s*󰳟\s*)?(.*)", label_text)
-                if match:
-                    prefix = match.group(1) or ""
-                    summary = match.group(2) or ""
-                else:
-                    prefix = ""
-                    summary = label_text
-                is_high_priority = hasattr(obj, 'priority') and obj.get_property('priority') == 'High'
-                is_collapsed = hasattr(obj, 'is_parent') and obj.is_parent and hasattr(obj, 'is_collapsed') and obj.is_collapsed
-                summary_markup = summary
-                if is_high_priority and is_collapsed:
-                    summary_markup = f'<u><b>{summary}</b></u>'
-                elif is_high_priority:
-                    summary_markup = f'<b>{summary}</b>'
-                elif is_collapsed:
-                    summary_markup = f'<u>{summary}</u>'
-                markup = f'{prefix}{summary_markup}'
-                summary_label.set_markup(markup)
-                # Show description below summary, smaller and lighter
-                if description:
-                    description_label.set_markup(f'<span size="small" foreground="#888">{description}</span>')
-                    description_label.set_visible(True)
-                else:
-                    description_label.set_visible(False)
+                # Use a vertical box to show summary and description
+                cell = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=0)
+                summary_label = Gtk.Label(xalign=0)
+                summary_label.set_ellipsize(Pango.EllipsizeMode.END)
+                summary_label.set_use_markup(True)
+                description_label = Gtk.Label(xalign=0, visible=False)
+                description_label.set_ellipsize(Pango.EllipsizeMode.END)
+                description_label.set_use_markup(True)
+                description_label.get_style_context().add_class("dim-label")  # For lighter font
+                cell.append(summary_label)
+                cell.append(description_label)
             else:
-                summary_label.set_text(label_text)
-                description_label.set_visible(False)
+                cell = Gtk.Label(xalign=0)
+                cell.set_ellipsize(Pango.EllipsizeMode.END)
+            list_item.set_child(cell)
+        return setup_handler
+
+    ### CELL RENDERING, ONLY WHAT DIFFERS FROM THE LAST VALUE SHOWN IN THE CELL
+    # Markup is precomputed with the row (tree.py), each cell widget keeps what was
+    # set on it last (cell.rendered) so recycled cells skip unchanged set_markup
+    # calls; it goes away with the widget
+    def _on_factory_bind(self, property_name):
+        if property_name == 'task':
+            def render(cell, obj):
+                markup = obj.markup
+                description = obj.description_markup
+                shown = getattr(cell, 'rendered', None)
+                if shown is None or shown[0] != markup:
+                    cell.get_first_child().set_markup(markup)
+                if shown is None or shown[1] != description:
+                    description_label = cell.get_last_child()
+                    description_label.set_markup(description)
+                    description_label.set_visible(bool(description))
+                cell.rendered = (markup, description)
+            signals = ("notify::markup", "notify::description-markup")
+        else:
+            label = CELL_LABELS[property_name]
+
+            def render(cell, obj):
+                value = obj.get_property(property_name)
+                if getattr(cell, 'rendered', None) != value:
+                    cell.set_text(label(value))
+                    cell.rendered = value
+            signals = (f"notify::{property_name}",)
+
+        def bind_handler(factory, list_item):
+            cell = list_item.get_child()
+            obj = list_item.get_item().get_item()
+            render(cell, obj)
+            # Rows updated in place by TaskModel.update re-render on notify
+            handlers = [obj.connect(signal, lambda obj, _: render(cell, obj)) for signal in signals]
+            self.bindings[list_item] = (obj, handlers)
 
         return bind_handler
 
+    def _on_factory_unbind(self, factory, list_item):
+        obj, handlers = self.bindings.pop(list_item, (None, ()))
+        for handler_id in handlers:
+            obj.disconnect(handler_id)
+
     def on_selection_changed(self, selection, position, n_items):
         num_selected = selection.get_selection().get_size()  # Use get_size() for Bitset
 
@@ -313,8 +512,13 @@ class Window(Gtk.ApplicationWindow):
             orientation=Gtk.Orientation.HORIZONTAL, 
             spacing=5
         )
+        # Shown while the list comes from the on-disk snapshot and is not revalidated yet
+        self.stale_label = Gtk.Label(label="󰅐 Cached", visible=False)
+        self.stale_label.set_tooltip_text("Showing the last synced copy, refreshing from the server")
+        self.stale_label.get_style_context().add_class("stale")
         # Append widgets to the Box
         self.status_container.append(self.spinner)
+        self.status_container.append(self.stale_label)
         self.status_container.append(self.status_bar)
         # Configure expand properties
         self.spinner.set_hexpand(False)
@@ -339,10 +543,7 @@ class Window(Gtk.ApplicationWindow):
     
     def on_row_activated(self, column_view, position):
         # Get the activated item
-        model = column_view.get_model()
-        item = model.get_item(position)
-        if hasattr(item, 'is_parent') and item.is_parent:
-            self.app.toggle_collapse(item.uid)
+        self.app.toggle_collapse(position)
 
 class MyApp(Gtk.Application):
 
@@ -0,0 +1,71 @@
+from gi.repository import GLib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import queue
+
+
+### RUN fn OVER items WITH AT MOST max_workers IN FLIGHT
+# Returns (item, result, error) per item, never raises for a single failure
+def run_bulk(items, fn, max_workers=8, progress=None):
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fn, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                results.append((item, future.result(), None))
+            except Exception as e:
+                results.append((item, None, e))
+            if progress is not None:
+                progress(len(results), len(items))
+    return results
+
+
+### BACKGROUND WORK QUEUE
+# Jobs run in order on one worker thread, so network I/O never blocks the GTK
+# main loop and a sync queued after a mutation sees its result. Callbacks and
+# UI state changes are marshalled back with GLib.idle_add.
+class WorkQueue:
+    def __init__(self, on_state):
+        # on_state(busy, status) is always called on the GTK thread
+        self.on_state = on_state
+        self.jobs = queue.Queue()
+        self.pending = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    ### CALLED FROM THE GTK THREAD
+    def submit(self, job, on_done=None, on_error=None, status=None):
+        if on_error is None:
+            on_error = lambda e: print(f"Background job failed: {e}")
+        self.pending += 1
+        self.on_state(True, status)
+        self.jobs.put((job, on_done, on_error))
+
+    @property
+    def busy(self):
+        return self.pending > 0
+
+    ### CALLED FROM A JOB, SHOWS PROGRESS IN THE STATUS BAR
+    def report(self, status):
+        GLib.idle_add(self.on_state, True, status)
+
+    def _run(self):
+        while True:
+            job, on_done, on_error = self.jobs.get()
+            try:
+                result = job()
+            except Exception as e:
+                GLib.idle_add(self._finish, on_error, e)
+            else:
+                GLib.idle_add(self._finish, on_done, result)
+
+    def _finish(self, callback, value):
+        self.pending -= 1
+        try:
+            if callback is not None:
+                callback(value)
+        finally:
+            if self.pending == 0:
+                self.on_state(False)
+        return False
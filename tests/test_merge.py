@@ -0,0 +1,117 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+from icalendar import Calendar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nctasks.merge import merge, split_vtodo  # noqa: E402
+
+
+def vtodo(*properties, alarm=None):
+    body = "".join(f"{line}\r\n" for line in properties)
+    if alarm:
+        body += f"BEGIN:VALARM\r\nACTION:DISPLAY\r\nDESCRIPTION:{alarm}\r\nTRIGGER:-PT15M\r\nEND:VALARM\r\n"
+    return (f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Server//EN\r\nBEGIN:VTODO\r\nUID:task-1\r\n"
+            f"{body}END:VTODO\r\nEND:VCALENDAR\r\n").encode()
+
+
+def fields(data):
+    todo = Calendar.from_ical(data).walk('VTODO')[0]
+    return {name: str(todo[name]) for name in ('SUMMARY', 'STATUS', 'PRIORITY', 'DESCRIPTION') if name in todo}
+
+
+BASE = vtodo("SUMMARY:Buy milk", "STATUS:NEEDS-ACTION", "PRIORITY:5")
+
+
+def test_change_on_one_side_each():
+    local = vtodo("SUMMARY:Buy milk", "STATUS:COMPLETED", "PRIORITY:5")
+    remote = vtodo("SUMMARY:Buy oat milk", "STATUS:NEEDS-ACTION", "PRIORITY:5")
+    merged, conflicts = merge(BASE, local, remote)
+    assert conflicts == []
+    assert fields(merged) == {'SUMMARY': 'Buy oat milk', 'STATUS': 'COMPLETED', 'PRIORITY': '5'}
+
+
+def test_only_local_change():
+    local = vtodo("SUMMARY:Buy milk", "STATUS:NEEDS-ACTION", "PRIORITY:1")
+    merged, conflicts = merge(BASE, local, BASE)
+    assert conflicts == []
+    assert fields(merged)['PRIORITY'] == '1'
+
+
+def test_both_sides_conflict_keeps_server():
+    local = vtodo("SUMMARY:Buy bread", "STATUS:COMPLETED", "PRIORITY:5")
+    remote = vtodo("SUMMARY:Buy eggs", "STATUS:NEEDS-ACTION", "PRIORITY:5")
+    merged, conflicts = merge(BASE, local, remote)
+    assert conflicts == ['SUMMARY']
+    assert fields(merged) == {'SUMMARY': 'Buy eggs', 'STATUS': 'COMPLETED', 'PRIORITY': '5'}
+
+
+def test_property_removed_locally():
+    base = vtodo("SUMMARY:Buy milk", "DESCRIPTION:Two litres", "PRIORITY:5")
+    local = vtodo("SUMMARY:Buy milk", "PRIORITY:5")
+    remote = vtodo("SUMMARY:Buy milk", "DESCRIPTION:Two litres", "PRIORITY:1")
+    merged, conflicts = merge(base, local, remote)
+    assert conflicts == []
+    assert fields(merged) == {'SUMMARY': 'Buy milk', 'PRIORITY': '1'}
+
+
+def test_property_removed_on_server_and_edited_locally():
+    base = vtodo("SUMMARY:Buy milk", "DESCRIPTION:Two litres")
+    local = vtodo("SUMMARY:Buy milk", "DESCRIPTION:Three litres")
+    remote = vtodo("SUMMARY:Buy milk")
+    merged, conflicts = merge(base, local, remote)
+    assert conflicts == ['DESCRIPTION']
+    assert merged is remote
+
+
+def test_valarm_kept_and_merged_as_one():
+    base = vtodo("SUMMARY:Buy milk", alarm="Milk")
+    local = vtodo("SUMMARY:Buy milk", "PRIORITY:1", alarm="Milk")
+    remote = vtodo("SUMMARY:Buy milk", alarm="Milk now")
+    merged, conflicts = merge(base, local, remote)
+    assert conflicts == []
+    alarm, = Calendar.from_ical(merged).walk('VALARM')
+    assert str(alarm['DESCRIPTION']) == 'Milk now'
+    assert fields(merged)['PRIORITY'] == '1'
+    assert split_vtodo(merged) is not None
+
+
+def test_noop_reserialised_by_icalendar():
+    remote = vtodo("SUMMARY:Call Bob\\, Alice", "STATUS:NEEDS-ACTION", "DUE;VALUE=DATE:20240301")
+    cal = Calendar()
+    cal.add('prodid', '-//NCTasks//')
+    cal.add('version', '2.0')
+    cal.add_component(Calendar.from_ical(remote).walk('VTODO')[0])
+    local = cal.to_ical()
+    merged, conflicts = merge(remote, local, remote)
+    assert conflicts == []
+    assert merged is remote
+
+
+def test_base_unknown():
+    local = vtodo("SUMMARY:Buy milk", "STATUS:COMPLETED")
+    remote = vtodo("SUMMARY:Buy milk", "STATUS:IN-PROCESS")
+    merged, conflicts = merge(None, local, remote)
+    assert conflicts == ['STATUS']
+    assert merged is remote
+    # Same content, e.g. a create whose response was lost
+    assert merge(None, remote, remote) == (remote, [])
+
+
+def test_bookkeeping_moves_forward():
+    base = vtodo("SUMMARY:Buy milk", "SEQUENCE:1", "LAST-MODIFIED:20240101T000000Z")
+    local = vtodo("SUMMARY:Buy milk", "PRIORITY:1", "SEQUENCE:1", "LAST-MODIFIED:20240101T000000Z")
+    remote = vtodo("SUMMARY:Buy oat milk", "SEQUENCE:4", "LAST-MODIFIED:20240601T000000Z")
+    merged, conflicts = merge(base, local, remote)
+    assert conflicts == []
+    todo = Calendar.from_ical(merged).walk('VTODO')[0]
+    assert int(todo['SEQUENCE']) == 5
+    assert todo['LAST-MODIFIED'].dt > datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def test_unmergeable():
+    two = vtodo("SUMMARY:a").replace(b"END:VCALENDAR", b"BEGIN:VTODO\r\nUID:task-2\r\nEND:VTODO\r\nEND:VCALENDAR")
+    assert merge(BASE, two, BASE) == (None, [])
+    other = vtodo("SUMMARY:Buy milk").replace(b"task-1", b"task-9")
+    assert merge(BASE, other, BASE) == (None, [])
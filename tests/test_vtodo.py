@@ -0,0 +1,99 @@
+import os
+import sys
+
+import pytest
+from icalendar import Calendar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nctasks.vtodo import parse_vtodos  # noqa: E402
+
+
+### REFERENCE: THE TaskRecord FIELDS AS READ THROUGH icalendar
+def icalendar_fields(data):
+    records = []
+    for todo in Calendar.from_ical(data).walk('VTODO'):
+        related_to = None
+        related = todo.get('related-to')
+        for value in related if isinstance(related, list) else [related] if related is not None else []:
+            if value.params.get('RELTYPE', 'PARENT').upper() == 'PARENT':
+                related_to = str(value)
+                break
+        due = todo.get('due')
+        priority = todo.get('priority')
+        records.append(dict(
+            uid=str(todo.get('uid', '')),
+            summary=str(todo['summary']) if 'summary' in todo else None,
+            description=str(todo['description']) if 'description' in todo else None,
+            priority=int(priority) if priority is not None else None,
+            status=str(todo['status']) if 'status' in todo else None,
+            due=due.dt if due is not None else None,
+            related_to=related_to
+        ))
+    return records
+
+
+def fast_fields(data):
+    return [{field: getattr(record, field) for field in record.__slots__} for record in parse_vtodos(data)]
+
+
+def vcalendar(*bodies):
+    todos = "".join(f"BEGIN:VTODO\r\n{body}END:VTODO\r\n" for body in bodies)
+    return f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Test//EN\r\n{todos}END:VCALENDAR\r\n".encode()
+
+
+CASES = {
+    'minimal': vcalendar(
+        "UID:minimal\r\nSUMMARY:Buy milk\r\n"),
+    'folded': vcalendar(
+        "UID:folded\r\nSUMMARY:A summary long enough to be folded over more than one\r\n"
+        "  content line by the client that wrote it\r\nDESCRIPTION:First\r\n\tsecond\r\n"),
+    'escapes': vcalendar(
+        "UID:escapes\r\nSUMMARY:Call Bob\\, Alice\\; then \\\\ home\r\n"
+        "DESCRIPTION:Line one\\nLine two\\NLine three\r\n"),
+    'utf8': vcalendar(
+        "UID:utf8\r\nSUMMARY:Caffè e tè \U0001F375\r\n"),
+    'due date': vcalendar(
+        "UID:due-date\r\nSUMMARY:Date\r\nDUE;VALUE=DATE:20240301\r\nPRIORITY:1\r\nSTATUS:NEEDS-ACTION\r\n"),
+    'due utc': vcalendar(
+        "UID:due-utc\r\nSUMMARY:UTC\r\nDUE:20240301T093000Z\r\nSTATUS:IN-PROCESS\r\nPRIORITY:5\r\n"),
+    'due tzid': vcalendar(
+        "UID:due-tzid\r\nSUMMARY:Zoned\r\nDUE;TZID=Europe/Rome:20240301T093000\r\n"),
+    'due floating': vcalendar(
+        "UID:due-floating\r\nSUMMARY:Floating\r\nDUE:20240301T093000\r\nSTATUS:COMPLETED\r\n"),
+    'valarm': vcalendar(
+        "UID:alarm\r\nSUMMARY:Outer\r\nBEGIN:VALARM\r\nACTION:DISPLAY\r\nDESCRIPTION:Inner\r\n"
+        "TRIGGER:-PT15M\r\nEND:VALARM\r\nPRIORITY:9\r\n"),
+    'reltype child': vcalendar(
+        "UID:parent\r\nSUMMARY:Parent\r\nRELATED-TO;RELTYPE=CHILD:child\r\n",
+        "UID:child\r\nSUMMARY:Child\r\nRELATED-TO;RELTYPE=PARENT:parent\r\n"),
+    'related-to default': vcalendar(
+        "UID:sub\r\nSUMMARY:Sub\r\nRELATED-TO:top\r\n"),
+    'multiple': vcalendar(
+        "UID:one\r\nSUMMARY:One\r\n",
+        "UID:two\r\nSUMMARY:Two\r\nPRIORITY:1\r\n",
+        "UID:three\r\nSUMMARY:Three\r\nDUE;VALUE=DATE:20241231\r\n"),
+}
+
+
+@pytest.mark.parametrize('data', CASES.values(), ids=CASES.keys())
+def test_matches_icalendar(data):
+    assert fast_fields(data) == icalendar_fields(data)
+
+
+def test_str_and_bytes_agree():
+    data = CASES['escapes']
+    assert fast_fields(data) == fast_fields(data.decode())
+
+
+def test_valarm_description_not_taken():
+    record, = parse_vtodos(CASES['valarm'])
+    assert record.description is None
+    assert record.priority == 9
+
+
+def test_due_kinds():
+    due = {record.uid: record.due for data in CASES.values() for record in parse_vtodos(data)}
+    assert due['due-tzid'].tzinfo is not None and str(due['due-tzid'].tzinfo) == 'Europe/Rome'
+    assert due['due-utc'].utcoffset().total_seconds() == 0
+    assert due['due-floating'].tzinfo is None
+    assert not hasattr(due['due-date'], 'hour')